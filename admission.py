@@ -0,0 +1,90 @@
+import asyncio
+import math
+import time
+from collections import deque
+
+from config import ADMISSION_BUDGET_SECONDS, ADMISSION_MEMORY_BYTES, ADMISSION_QUEUE_SIZE, THREAD_WORKERS
+from metrics import ADMISSION_QUEUE_DEPTH, ADMISSION_WAIT_SECONDS, ADMITTED_WORK_SECONDS
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Server is busy, retry in {retry_after} s")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    # Admits requests while the estimated processing seconds (and optionally the estimated peak memory)
+    # of those running stay within budget. The others wait in arrival order, so a large request is not
+    # overtaken indefinitely by small ones, and once `max_queue` are waiting new requests are refused.
+    # A request is always admitted when nothing is running, however large. Only the event loop uses it.
+
+    def __init__(self, budget=ADMISSION_BUDGET_SECONDS, memory_budget=ADMISSION_MEMORY_BYTES,
+                 max_queue=ADMISSION_QUEUE_SIZE, workers=THREAD_WORKERS):
+        self.budget = budget
+        self.memory_budget = memory_budget
+        self.max_queue = max_queue
+        self.workers = workers
+        self.running = 0
+        self.work = 0.0
+        self.memory = 0
+        self.waiting = deque()
+
+    def _fits(self, cost, memory):
+        if not self.budget or self.running == 0:
+            return True
+        if self.memory_budget and self.memory + memory > self.memory_budget:
+            return False
+        return self.work + cost <= self.budget
+
+    def _start(self, cost, memory):
+        self.running += 1
+        self.work += cost
+        self.memory += memory
+        ADMITTED_WORK_SECONDS.set(self.work)
+
+    def _wake(self):
+        while self.waiting and self._fits(*self.waiting[0][:2]):
+            cost, memory, waiter = self.waiting.popleft()
+            self._start(cost, memory)
+            waiter.set_result(None)
+        ADMISSION_QUEUE_DEPTH.set(len(self.waiting))
+
+    def retry_after(self):
+        # Seconds until the work running and waiting now should be done, spread over the workers
+        queued = sum(cost for cost, _, _ in self.waiting)
+        return max(1, math.ceil((self.work + queued) / max(self.workers, 1)))
+
+    async def acquire(self, cost, memory=0, endpoint="", bounded=True):
+        # Wait until the request may run; every successful acquire must be matched by a release. Work
+        # that is already queued elsewhere, such as jobs, passes bounded=False to wait however long the line.
+        started = time.perf_counter()
+        if not self.waiting and self._fits(cost, memory):
+            self._start(cost, memory)
+        else:
+            if bounded and len(self.waiting) >= self.max_queue:
+                raise Overloaded(self.retry_after())
+            entry = (cost, memory, asyncio.get_running_loop().create_future())
+            self.waiting.append(entry)
+            ADMISSION_QUEUE_DEPTH.set(len(self.waiting))
+            try:
+                await entry[2]
+            except asyncio.CancelledError:
+                # The client went away while waiting, or just after being admitted
+                if entry in self.waiting:
+                    self.waiting.remove(entry)
+                    self._wake()
+                else:
+                    self.release(cost, memory)
+                raise
+        ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+
+    def release(self, cost, memory=0):
+        self.running -= 1
+        self.work = max(self.work - cost, 0.0) if self.running else 0.0
+        self.memory = self.memory - memory if self.running else 0
+        ADMITTED_WORK_SECONDS.set(self.work)
+        self._wake()
+
+
+admission = AdmissionController()
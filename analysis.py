@@ -0,0 +1,111 @@
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import librosa
+
+from config import ANALYSIS_CACHE_BYTES
+
+N_FFT = 2048
+
+_current = contextvars.ContextVar("analysis_cache", default=None)
+
+
+class AnalysisCache:
+    # Spectrograms of the signals seen during one render, keyed by the identity of the analysed array.
+    # Entries keep their array alive, so an id is never reused while its entry exists; anything that
+    # modifies an array in place must forget() it first.
+
+    def __init__(self, max_bytes=ANALYSIS_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, audio_data, key):
+        entry = self._entries.get((id(audio_data),) + key)
+        if entry is None or entry[0] is not audio_data:
+            self.misses += 1
+            return None
+        self._entries.move_to_end((id(audio_data),) + key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, audio_data, key, value):
+        # Spectrograms larger than the whole budget are not kept; otherwise the least recently used go first
+        if value.nbytes > self.max_bytes:
+            return
+        full_key = (id(audio_data),) + key
+        if full_key in self._entries:
+            self.nbytes -= self._entries.pop(full_key)[1].nbytes
+        self._entries[full_key] = (audio_data, value)
+        self.nbytes += value.nbytes
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+    def forget(self, audio_data):
+        for key in [key for key in self._entries if key[0] == id(audio_data)]:
+            self.nbytes -= self._entries.pop(key)[1].nbytes
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+
+@contextmanager
+def analysis_scope(max_bytes=ANALYSIS_CACHE_BYTES):
+    # Share spectrograms between the stages run inside the block; nested scopes join the outer one.
+    # Everything is released when the outermost scope exits.
+    cache = _current.get()
+    if cache is not None:
+        yield cache
+        return
+    cache = AnalysisCache(max_bytes)
+    token = _current.set(cache)
+    try:
+        yield cache
+    finally:
+        _current.reset(token)
+        cache.clear()
+
+
+def forget(audio_data):
+    cache = _current.get()
+    if cache is not None:
+        cache.forget(audio_data)
+
+
+def stft(audio_data, n_fft=N_FFT, hop_length=None):
+    # librosa.stft, computed once per array and parameters inside an analysis scope
+    cache = _current.get()
+    key = ("stft", n_fft, hop_length)
+    spectrogram = cache.get(audio_data, key) if cache is not None else None
+    if spectrogram is None:
+        spectrogram = librosa.stft(audio_data, n_fft=n_fft, hop_length=hop_length)
+        if cache is not None:
+            cache.put(audio_data, key, spectrogram)
+    return spectrogram
+
+
+def time_stretch(audio_data, rate):
+    # librosa.effects.time_stretch on the shared analysis
+    if rate <= 0:
+        raise ValueError("rate must be a positive number")
+    stretched = librosa.phase_vocoder(stft(audio_data), rate=rate)
+    return librosa.istft(stretched, dtype=audio_data.dtype, length=int(round(audio_data.shape[-1] / rate)))
+
+
+def pitch_shift(audio_data, sr, n_steps, res_type="kaiser_best"):
+    # librosa.effects.pitch_shift on the shared analysis
+    rate = 2.0 ** (-float(n_steps) / 12)
+    shifted = librosa.resample(time_stretch(audio_data, rate), orig_sr=float(sr) / rate, target_sr=sr,
+                               res_type=res_type)
+    return librosa.util.fix_length(shifted, size=audio_data.shape[-1])
+
+
+def harmonic(audio_data, margin=1.0):
+    # librosa.effects.harmonic on the shared analysis
+    harmonic_spectrogram = librosa.decompose.hpss(stft(audio_data), margin=margin)[0]
+    return librosa.istft(harmonic_spectrogram, dtype=audio_data.dtype, length=audio_data.shape[-1])
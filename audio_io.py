@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+from fractions import Fraction
+
+import librosa
+import numpy as np
+import soundfile as sf
+from scipy.signal import resample_poly
+
+from config import DECODE_BLOCK_SIZE, MAX_PROCESSING_SR
+
+
+def file_size(file_obj):
+    # Size in bytes of a seekable file-like object, leaving its position unchanged
+    position = file_obj.tell()
+    file_obj.seek(0, os.SEEK_END)
+    size = file_obj.tell()
+    file_obj.seek(position)
+    return size
+
+
+def to_mono(audio_data):
+    # (samples, channels) float32 -> (samples,), averaging channels like librosa.load does
+    if audio_data.shape[1] == 1:
+        return audio_data[:, 0]
+    return audio_data.mean(axis=1)
+
+
+def window_frames(sr, frames, offset=0.0, duration=None):
+    # (start, stop) frame indices of the requested window, clamped to the file
+    start = min(int(round((offset or 0.0) * sr)), frames)
+    stop = frames if duration is None else min(start + int(round(duration * sr)), frames)
+    return start, stop
+
+
+def read_frames(sound_file, start, stop, blocksize=DECODE_BLOCK_SIZE, keep_channels=False):
+    # Decode frames [start, stop) as float32. Multichannel audio is downmixed block by block into one
+    # mono output buffer, so the interleaved file is never held in memory whole. With keep_channels it
+    # is deinterleaved the same way into a (channels, samples) array instead.
+    sound_file.seek(start)
+    frames = stop - start
+    if sound_file.channels == 1:
+        return sound_file.read(frames, dtype='float32')
+    channels = sound_file.channels if keep_channels else None
+    audio_data = np.empty(frames if channels is None else (channels, frames), dtype=np.float32)
+    position = 0
+    for block in sound_file.blocks(blocksize, frames=frames, dtype='float32', always_2d=True):
+        audio_data[..., position:position + block.shape[0]] = to_mono(block) if channels is None else block.T
+        position += block.shape[0]
+    return audio_data[..., :position]
+
+
+def resample_to(audio_data, sr, target_sr):
+    # Polyphase resampling by the exact rational ratio between the two rates
+    if sr == target_sr:
+        return audio_data
+    ratio = Fraction(int(target_sr), int(sr))
+    return resample_poly(audio_data, ratio.numerator, ratio.denominator, axis=-1).astype(np.float32)
+
+
+def limit_rate(audio_data, sr, max_sr=MAX_PROCESSING_SR):
+    # Resample audio above the processing rate cap down to it; every effect then costs what it would at the cap
+    if not max_sr or sr <= max_sr:
+        return audio_data, sr
+    return resample_to(audio_data, sr, max_sr), int(max_sr)
+
+
+def _decode_via_temp_file(file_obj, filename=None, offset=0.0, duration=None, keep_channels=False):
+    # Formats libsndfile cannot read go through librosa's audioread fallback, which needs a real path.
+    # Each request gets its own temp file so concurrent uploads never share one.
+    suffix = os.path.splitext(filename or "")[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as temp_file:
+        shutil.copyfileobj(file_obj, temp_file)
+        temp_file_path = temp_file.name
+    try:
+        return librosa.load(temp_file_path, sr=None, mono=not keep_channels, offset=offset or 0.0,
+                            duration=duration)
+    finally:
+        os.remove(temp_file_path)
+
+
+def decode_audio_file(file_obj, filename=None, offset=0.0, duration=None, max_sr=MAX_PROCESSING_SR,
+                      keep_channels=False):
+    # Decode an uploaded file-like object (in memory or spooled) to mono float32, or with keep_channels
+    # to (channels, samples) when it has more than one. libsndfile handles WAV, FLAC, OGG and MP3 in
+    # process and only the frames inside the window are decoded.
+    file_obj.seek(0)
+    try:
+        sound_file = sf.SoundFile(file_obj)
+    except sf.LibsndfileError:
+        file_obj.seek(0)
+        audio_data, sr = _decode_via_temp_file(file_obj, filename, offset, duration, keep_channels)
+    else:
+        with sound_file:
+            sr = sound_file.samplerate
+            audio_data = read_frames(sound_file, *window_frames(sr, sound_file.frames, offset, duration),
+                                     keep_channels=keep_channels)
+    return limit_rate(audio_data, sr, max_sr)
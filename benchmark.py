@@ -0,0 +1,271 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import warnings
+
+import numpy as np
+
+DEFAULT_DURATIONS = (5, 30, 120, 600)
+DEFAULT_RATES = (16000, 22050, 44100, 48000)
+SAMPLE_AUDIOS = "sample_audios/*.mp3"
+DEFAULT_PITCH_ENGINE = "phase_vocoder"
+
+
+def synthetic_clip(duration, sr, seed=0):
+    # A deterministic speech-like test signal: a gliding harmonic tone with syllable-rate amplitude
+    # modulation plus a little noise
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sr)) / sr
+    f0 = 140 + 30 * np.sin(2 * np.pi * 0.3 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 4 * t)) ** 2
+    clip = 0.1 * voiced * envelope + 0.005 * rng.standard_normal(len(t))
+    return clip.astype(np.float32)
+
+
+def load_input(source, duration, sr):
+    if source == "synthetic":
+        return synthetic_clip(duration, sr)
+    import librosa
+    from audio_io import decode_audio_file
+    with open(source, "rb") as file_obj:
+        audio_data, native_sr = decode_audio_file(file_obj, source)
+    if native_sr != sr:
+        audio_data = librosa.resample(audio_data, orig_sr=native_sr, target_sr=sr, res_type='polyphase')
+    return audio_data
+
+
+def effect_for(kind, name, pitch_engine=DEFAULT_PITCH_ENGINE):
+    if kind == "background":
+        from effects import apply_effect
+        return lambda audio_data, sr: apply_effect(audio_data, sr, name, start_effect=0, factor=3)
+    from presets import render_preset
+    return lambda audio_data, sr: render_preset(name, audio_data, sr, pitch_engine=pitch_engine)
+
+
+def log_spectral_distance(processed, reference, n_fft=2048):
+    # RMS difference in dB between the magnitude spectra, over the frames where the reference is
+    # within 60 dB of its loudest frame. Both are floored 80 dB below the reference peak, so bins
+    # that are silent in both do not count.
+    import librosa
+    length = min(processed.shape[-1], reference.shape[-1])
+    spectra = [20 * np.log10(np.abs(librosa.stft(audio_data[:length], n_fft=n_fft)) + 1e-10)
+               for audio_data in (processed, reference)]
+    floor = spectra[1].max() - 80
+    spectra = [np.maximum(spectrum, floor) for spectrum in spectra]
+    frame_level = spectra[1].max(axis=0)
+    active = frame_level > frame_level.max() - 60
+    distance = np.sqrt(np.mean((spectra[0] - spectra[1]) ** 2, axis=0))
+    return float(distance[active].mean())
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(case):
+    # Runs in a fresh worker process, so the peak RSS belongs to this case alone
+    warnings.simplefilter("ignore")
+    kind, name, source, duration, sr, repeat, pitch_engine, output_formats = case
+    effect = effect_for(kind, name, pitch_engine)
+    # Warm up caches and JIT-compiled code on a short clip first
+    effect(synthetic_clip(0.5, sr), sr)
+    audio_data = load_input(source, duration, sr)
+    rss_before = peak_rss_mb()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        processed = effect(np.copy(audio_data), sr)
+        times.append(time.perf_counter() - start)
+    audio_duration = audio_data.shape[-1] / sr
+    wall = min(times)
+    # Other pitch engines are scored against the phase vocoder render of the same input
+    distance = None
+    if pitch_engine != DEFAULT_PITCH_ENGINE:
+        reference = effect_for(kind, name)(np.copy(audio_data), sr)
+        distance = log_spectral_distance(processed, reference)
+    # Size of the encoded output per second of audio, for each output format
+    from encoding import encode_output
+    encoded = {}
+    for output_format in output_formats:
+        start = time.perf_counter()
+        size = len(encode_output(processed, sr, output_format))
+        encoded[output_format] = {"bytes_per_s": size * sr / max(processed.shape[-1], 1),
+                                  "encode_s": time.perf_counter() - start}
+    return {
+        "kind": kind,
+        "preset": name,
+        "pitch_engine": pitch_engine,
+        "input": "synthetic" if source == "synthetic" else os.path.basename(source),
+        "duration_s": round(audio_duration, 3),
+        "sr": sr,
+        "wall_s": wall,
+        "rtf": wall / audio_duration,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_delta_mb": peak_rss_mb() - rss_before,
+        "output_samples": int(processed.shape[-1]),
+        "lsd_db": distance,
+        "encoded": encoded,
+    }
+
+
+def build_cases(presets, backgrounds, durations, rates, samples, repeat, pitch_engines=(DEFAULT_PITCH_ENGINE,),
+                output_formats=("wav",)):
+    from presets import effective_pitch_engine
+
+    cases = []
+    for kind, names in (("preset", presets), ("background", backgrounds)):
+        for name in names:
+            # Only presets that pitch-shift are run once per engine
+            engines = [DEFAULT_PITCH_ENGINE] if kind == "background" else list(dict.fromkeys(
+                effective_pitch_engine(name, pitch_engine) for pitch_engine in pitch_engines))
+            for pitch_engine in engines:
+                for sr in rates:
+                    for duration in durations:
+                        cases.append((kind, name, "synthetic", duration, sr, repeat, pitch_engine, output_formats))
+                    for sample in samples:
+                        cases.append((kind, name, sample, None, sr, repeat, pitch_engine, output_formats))
+    return cases
+
+
+def scaling_report(results, threshold):
+    # Fit time ~ duration ** k over the synthetic clips of each (preset, rate); k > threshold means
+    # the preset scales worse than linearly with input length
+    groups = {}
+    for result in results:
+        if result["input"] == "synthetic":
+            groups.setdefault((result["kind"], result["preset"], result.get("pitch_engine", DEFAULT_PITCH_ENGINE),
+                               result["sr"]), []).append(result)
+    report = []
+    for (kind, name, pitch_engine, sr), group in sorted(groups.items()):
+        if len(group) < 2:
+            continue
+        durations = np.log([result["duration_s"] for result in group])
+        times = np.log([max(result["wall_s"], 1e-6) for result in group])
+        exponent = float(np.polyfit(durations, times, 1)[0])
+        report.append({"kind": kind, "preset": name, "pitch_engine": pitch_engine, "sr": sr, "exponent": exponent,
+                       "superlinear": exponent > threshold})
+    return report
+
+
+def metadata():
+    import librosa
+    import scipy
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "librosa": librosa.__version__,
+    }
+
+
+def run_benchmarks(args):
+    from encoding import AVAILABLE_FORMATS
+    from presets import PRESETS
+    from sound_cache import available_sounds
+
+    presets = args.presets or list(PRESETS)
+    backgrounds = available_sounds() if args.backgrounds is None else args.backgrounds
+    samples = sorted(glob.glob(SAMPLE_AUDIOS)) if args.samples else []
+    output_formats = AVAILABLE_FORMATS if args.output_formats is None else args.output_formats
+    cases = build_cases(presets, backgrounds, args.durations, args.rates, samples, args.repeat, args.pitch_engines,
+                        output_formats)
+
+    results = []
+    # One process per case keeps peak RSS measurements independent of each other
+    with multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+        for index, result in enumerate(pool.imap(run_case, cases), 1):
+            results.append(result)
+            quality = "" if result["lsd_db"] is None else f"  lsd {result['lsd_db']:.2f} dB"
+            quality += "".join(f"  {output_format} {encoded['bytes_per_s'] / 1000:.1f} kB/s"
+                               for output_format, encoded in result["encoded"].items())
+            print(f"[{index}/{len(cases)}] {result['kind']:10s} {result['preset']:16s} {result['pitch_engine']:13s} "
+                  f"{result['input']:24s} {result['duration_s']:8.1f}s {result['sr']:6d} Hz  {result['wall_s']:8.3f}s  "
+                  f"rtf {result['rtf']:.4f}  rss {result['peak_rss_mb']:.0f} MB{quality}", flush=True)
+
+    scaling = scaling_report(results, args.scaling_threshold)
+    for entry in scaling:
+        if entry["superlinear"]:
+            print(f"superlinear: {entry['kind']} {entry['preset']} ({entry['pitch_engine']}) at {entry['sr']} Hz "
+                  f"(time ~ duration^{entry['exponent']:.2f})")
+    with open(args.output, "w") as output_file:
+        json.dump({"meta": metadata(), "results": results, "scaling": scaling}, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+
+def compare(old_path, new_path, threshold):
+    # Print the wall-time ratio new/old for every case present in both runs
+    def load(path):
+        with open(path) as result_file:
+            results = json.load(result_file)["results"]
+        return {(r["kind"], r["preset"], r.get("pitch_engine", DEFAULT_PITCH_ENGINE), r["input"], r["duration_s"],
+                 r["sr"]): r for r in results}
+
+    old, new = load(old_path), load(new_path)
+    regressions = 0
+    for key in sorted(old.keys() & new.keys()):
+        ratio = new[key]["wall_s"] / max(old[key]["wall_s"], 1e-9)
+        marker = ""
+        if ratio > 1 + threshold:
+            marker = "  REGRESSION"
+            regressions += 1
+        elif ratio < 1 - threshold:
+            marker = "  faster"
+        kind, name, pitch_engine, source, duration, sr = key
+        print(f"{kind:10s} {name:16s} {pitch_engine:13s} {source:24s} {duration:8.1f}s {sr:6d} Hz  "
+              f"{old[key]['wall_s']:8.3f}s -> {new[key]['wall_s']:8.3f}s  x{ratio:.2f}{marker}")
+    for key in sorted(old.keys() ^ new.keys()):
+        print(f"only in {'old' if key in old else 'new'}: {key}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every preset and background effect.")
+    parser.add_argument("--presets", nargs="*", help="Presets to run (default: all)")
+    parser.add_argument("--backgrounds", nargs="*", help="Background sounds for apply_effect (default: all)")
+    parser.add_argument("--durations", nargs="*", type=float, default=DEFAULT_DURATIONS,
+                        help="Synthetic clip durations in seconds")
+    parser.add_argument("--rates", nargs="*", type=int, default=DEFAULT_RATES, help="Sample rates")
+    parser.add_argument("--no-samples", dest="samples", action="store_false",
+                        help=f"Skip {SAMPLE_AUDIOS}")
+    parser.add_argument("--pitch-engines", nargs="*", default=[DEFAULT_PITCH_ENGINE],
+                        help="Pitch engines to run pitch-shifting presets with; engines other than the phase "
+                             "vocoder also report their log-spectral distance (lsd_db) from it")
+    parser.add_argument("--output-formats", nargs="*",
+                        help="Output formats whose encoded size (bytes per second of audio) and encode time are "
+                             "reported for every case (default: every format the installed libsndfile writes)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per case; the fastest is reported")
+    parser.add_argument("--scaling-threshold", type=float, default=1.15,
+                        help="Flag presets whose time grows faster than duration ** threshold")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="Compare two result files instead of running")
+    parser.add_argument("--regression-threshold", type=float, default=0.1,
+                        help="Relative slowdown reported as a regression by --compare")
+    args = parser.parse_args(argv)
+    if args.compare:
+        return 1 if compare(*args.compare, args.regression_threshold) else 0
+    run_benchmarks(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
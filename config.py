@@ -0,0 +1,74 @@
+import os
+import tempfile
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _env_list(name, default, cast=str):
+    value = os.environ.get(name, default)
+    return tuple(cast(item.strip()) for item in value.split(",") if item.strip())
+
+
+# Directory holding the background sounds used by /voice_effect and the alien/radio presets
+EFFECTS_SOUNDS_DIR = os.environ.get("VOICE_CHANGER_EFFECTS_SOUNDS_DIR", "effects_sounds")
+
+# Decoded background sound cache
+OVERLAY_CACHE_SIZE = _env_int("VOICE_CHANGER_OVERLAY_CACHE_SIZE", 64)
+OVERLAY_PREWARM_RATES = _env_list("VOICE_CHANGER_OVERLAY_PREWARM_RATES", "16000,22050,44100,48000", int)
+OVERLAY_PREWARM_GAIN = 0.3
+
+# Where effect processing runs: "auto" sends GIL-bound presets to the process pool and the rest
+# to the thread pool; "thread", "process" and "inline" force one backend for every preset
+EXECUTOR_BACKEND = os.environ.get("VOICE_CHANGER_EXECUTOR", "auto")
+THREAD_WORKERS = _env_int("VOICE_CHANGER_THREAD_WORKERS", os.cpu_count() or 4)
+PROCESS_WORKERS = _env_int("VOICE_CHANGER_PROCESS_WORKERS", os.cpu_count() or 4)
+PROCESS_START_METHOD = os.environ.get("VOICE_CHANGER_PROCESS_START_METHOD", "spawn")
+
+# Upper bound on the spectrograms kept for reuse between the stages of one render
+ANALYSIS_CACHE_BYTES = _env_int("VOICE_CHANGER_ANALYSIS_CACHE_BYTES", 512 * 1024 * 1024)
+
+# Uploads above this sample rate are resampled down to it before processing (0 disables the cap)
+MAX_PROCESSING_SR = _env_int("VOICE_CHANGER_MAX_PROCESSING_SR", 0)
+# Frames decoded per block when downmixing multichannel uploads
+DECODE_BLOCK_SIZE = _env_int("VOICE_CHANGER_DECODE_BLOCK_SIZE", 65536)
+
+# Frames per block in the streaming render mode
+STREAM_BLOCK_SIZE = _env_int("VOICE_CHANGER_STREAM_BLOCK_SIZE", 65536)
+
+# Rendered results keyed by upload content and request parameters: an in-memory LRU tier and an
+# optional on-disk tier (disabled while the directory is empty)
+RESULT_CACHE_MEMORY_BYTES = _env_int("VOICE_CHANGER_RESULT_CACHE_MEMORY_BYTES", 256 * 1024 * 1024)
+RESULT_CACHE_DIR = os.environ.get("VOICE_CHANGER_RESULT_CACHE_DIR", "")
+RESULT_CACHE_DISK_BYTES = _env_int("VOICE_CHANGER_RESULT_CACHE_DISK_BYTES", 2 * 1024 * 1024 * 1024)
+
+# Live WebSocket sessions: frames that waited longer than this are late (or dropped), and no
+# single frame may be longer than LIVE_MAX_FRAME_MS
+LIVE_MAX_LATENCY_MS = _env_int("VOICE_CHANGER_LIVE_MAX_LATENCY_MS", 250)
+LIVE_MAX_FRAME_MS = _env_int("VOICE_CHANGER_LIVE_MAX_FRAME_MS", 1000)
+
+# Upload limits, each disabled at 0: request bodies over MAX_UPLOAD_BYTES are refused, and uploads
+# whose container header shows more than MAX_UPLOAD_SECONDS of audio (within the requested window)
+# are rejected, or cut to that length when OVERLONG_UPLOADS is "trim", before they are decoded
+MAX_UPLOAD_BYTES = _env_int("VOICE_CHANGER_MAX_UPLOAD_BYTES", 0)
+MAX_UPLOAD_SECONDS = float(os.environ.get("VOICE_CHANGER_MAX_UPLOAD_SECONDS", 0))
+OVERLONG_UPLOADS = os.environ.get("VOICE_CHANGER_OVERLONG_UPLOADS", "reject")
+# Uploaded files larger than this are spooled to a temporary file rather than kept in memory
+UPLOAD_SPOOL_BYTES = _env_int("VOICE_CHANGER_UPLOAD_SPOOL_BYTES", 1024 * 1024)
+
+# Admission control: requests are admitted while the estimated processing seconds of those running
+# stay within ADMISSION_BUDGET_SECONDS (0 admits everything) and, if set, their estimated peak memory
+# within ADMISSION_MEMORY_BYTES. Others wait in line; once ADMISSION_QUEUE_SIZE are waiting, new
+# requests are answered with 429.
+ADMISSION_BUDGET_SECONDS = float(os.environ.get("VOICE_CHANGER_ADMISSION_BUDGET_SECONDS", 2 * THREAD_WORKERS))
+ADMISSION_MEMORY_BYTES = _env_int("VOICE_CHANGER_ADMISSION_MEMORY_BYTES", 0)
+ADMISSION_QUEUE_SIZE = _env_int("VOICE_CHANGER_ADMISSION_QUEUE_SIZE", 64)
+
+# Asynchronous jobs: uploads, status and results are kept under JOBS_DIR. At most JOB_WORKERS jobs
+# render at once and at most JOB_QUEUE_SIZE may be unfinished; finished jobs are deleted after
+# JOB_TTL_SECONDS.
+JOBS_DIR = os.environ.get("VOICE_CHANGER_JOBS_DIR", os.path.join(tempfile.gettempdir(), "voice_changer_jobs"))
+JOB_WORKERS = _env_int("VOICE_CHANGER_JOB_WORKERS", 2)
+JOB_QUEUE_SIZE = _env_int("VOICE_CHANGER_JOB_QUEUE_SIZE", 100)
+JOB_TTL_SECONDS = _env_int("VOICE_CHANGER_JOB_TTL_SECONDS", 3600)
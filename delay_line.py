@@ -0,0 +1,38 @@
+import numpy as np
+
+
+def delay_samples_for(sr, delay_time):
+    # Convert a delay in seconds to a whole number of samples
+    return int(sr * delay_time)
+
+
+def feedforward_echo(audio_data, sr, delay_time=0.5, decay=0.5, taps=1):
+    # Add `taps` delayed copies of the dry signal, each one `delay_time` later and `decay` quieter
+    delay_samples = delay_samples_for(sr, delay_time)
+    length = audio_data.shape[-1]
+    echo_audio = np.copy(audio_data)
+    gain = 1.0
+    for tap in range(1, taps + 1):
+        offset = tap * delay_samples
+        if offset >= length:
+            break
+        gain *= decay
+        echo_audio[..., offset:] += gain * audio_data[..., :length - offset]
+    return echo_audio
+
+
+def feedback_delay(audio_data, sr, delay_time=0.1, feedback=0.4):
+    # Feedback comb filter: y[n] = x[n] + feedback * y[n - D], computed one delay period at a time.
+    # The first period is left silent, as in the original per-sample implementation.
+    delay_samples = delay_samples_for(sr, delay_time)
+    length = audio_data.shape[-1]
+    delayed_audio = np.zeros_like(audio_data)
+    if delay_samples <= 0:
+        delayed_audio[...] = audio_data
+        return delayed_audio
+    for start in range(delay_samples, length, delay_samples):
+        end = min(start + delay_samples, length)
+        previous = delayed_audio[..., start - delay_samples:end - delay_samples]
+        np.multiply(previous, feedback, out=delayed_audio[..., start:end])
+        delayed_audio[..., start:end] += audio_data[..., start:end]
+    return delayed_audio
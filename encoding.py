@@ -0,0 +1,196 @@
+import soundfile as sf
+
+from audio_io import resample_to
+from streaming import array_blocks, stream_wav
+
+# Sample rates the Opus encoder accepts
+OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+# Highest output sample rate a client may ask for
+MAX_OUTPUT_SR = 192000
+
+
+class OutputFormat:
+    def __init__(self, container, subtype, media_type, extension, sample_rates=None):
+        self.container = container
+        self.subtype = subtype
+        self.media_type = media_type
+        self.extension = extension
+        # None when the encoder takes any rate
+        self.sample_rates = sample_rates
+
+
+OUTPUT_FORMATS = {
+    "wav": OutputFormat("WAV", "PCM_16", "audio/wav", "wav"),
+    "wav_float": OutputFormat("WAV", "FLOAT", "audio/wav", "wav"),
+    "flac": OutputFormat("FLAC", "PCM_16", "audio/flac", "flac"),
+    "ogg": OutputFormat("OGG", "VORBIS", "audio/ogg", "ogg"),
+    "opus": OutputFormat("OGG", "OPUS", "audio/ogg; codecs=opus", "opus", OPUS_RATES),
+}
+
+# The formats the installed libsndfile can write
+AVAILABLE_FORMATS = [name for name, output_format in OUTPUT_FORMATS.items()
+                     if sf.check_format(output_format.container, output_format.subtype)]
+
+# Accept header media types and the formats they select
+ACCEPT_TYPES = {
+    "audio/wav": "wav",
+    "audio/wave": "wav",
+    "audio/x-wav": "wav",
+    "audio/vnd.wave": "wav",
+    "audio/flac": "flac",
+    "audio/x-flac": "flac",
+    "audio/ogg": "ogg",
+    "audio/vorbis": "ogg",
+    "audio/opus": "opus",
+}
+
+
+def _accepted(accept):
+    # (format, quality) for every supported media range of an Accept header, in header order
+    for media_range in accept.split(","):
+        media_type, *params = [part.strip().lower() for part in media_range.split(";")]
+        quality = 1.0
+        name = ACCEPT_TYPES.get(media_type)
+        for param in params:
+            key, _, value = param.partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+            elif key == "codecs" and media_type == "audio/ogg" and "opus" in value:
+                name = "opus"
+        if name in AVAILABLE_FORMATS and quality > 0:
+            yield name, quality
+
+
+def negotiate_format(output_format=None, accept=None):
+    # An explicit output_format wins; otherwise the supported type the Accept header prefers, then WAV
+    if output_format is not None:
+        if output_format not in AVAILABLE_FORMATS:
+            raise ValueError(f"Invalid output format. Available formats are: {AVAILABLE_FORMATS}")
+        return output_format
+    best = max(_accepted(accept or ""), key=lambda accepted: accepted[1], default=None)
+    return best[0] if best else "wav"
+
+
+def check_output_rate(output_format, output_sample_rate):
+    if output_sample_rate is None:
+        return
+    rates = OUTPUT_FORMATS[output_format].sample_rates
+    if output_sample_rate <= 0 or output_sample_rate > MAX_OUTPUT_SR:
+        raise ValueError(f"output_sample_rate must be between 1 and {MAX_OUTPUT_SR}")
+    if rates is not None and output_sample_rate not in rates:
+        raise ValueError(f"{output_format} only supports the sample rates {list(rates)}")
+
+
+def encoded_rate(output_format, sr, output_sample_rate=None):
+    # The rate the output is encoded at: the requested one, else the rendered one, moved up to the
+    # nearest rate the encoder supports
+    check_output_rate(output_format, output_sample_rate)
+    if output_sample_rate is not None:
+        return output_sample_rate
+    rates = OUTPUT_FORMATS[output_format].sample_rates
+    if rates is None or sr in rates:
+        return sr
+    return min((rate for rate in rates if rate >= sr), default=max(rates))
+
+
+class _ChunkSink:
+    # Write-only file object for libsndfile that hands out what has been written so far. Encoders
+    # that seek back at the end to patch their header cannot change bytes already handed out, so
+    # such writes are dropped; the formats streamed this way stay valid without them.
+
+    def __init__(self):
+        self.pending = bytearray()
+        self.sent = 0
+        self.position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        size = len(data)
+        offset = self.position - self.sent
+        if offset < 0:
+            data = data[-offset:]
+            offset = 0
+        if data:
+            end = offset + len(data)
+            if end > len(self.pending):
+                self.pending.extend(bytes(end - len(self.pending)))
+            self.pending[offset:end] = data
+        self.position += size
+        return size
+
+    def seek(self, offset, whence=0):
+        if whence == 0:
+            self.position = offset
+        elif whence == 1:
+            self.position += offset
+        else:
+            self.position = self.sent + len(self.pending) + offset
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def read(self, size=-1):
+        return b""
+
+    def take(self):
+        data = bytes(self.pending)
+        self.sent += len(data)
+        self.pending.clear()
+        return data
+
+
+def _set_flac_length(header, frames):
+    # FLAC writes its total sample count when it finishes, by seeking back to STREAMINFO. The count is
+    # known up front here, so it goes into the 36-bit field directly (bytes 21-25 of the file).
+    header = bytearray(header)
+    header[21] = (header[21] & 0xF0) | ((frames >> 32) & 0x0F)
+    header[22:26] = (frames & 0xFFFFFFFF).to_bytes(4, "big")
+    return bytes(header)
+
+
+def _stream_sound_file(blocks, sr, frames, output_format, channels):
+    sink = _ChunkSink()
+    patched = output_format.container != "FLAC"
+
+    def take():
+        nonlocal patched
+        data = sink.take()
+        if data and not patched:
+            data = _set_flac_length(data, frames)
+            patched = True
+        return data
+
+    with sf.SoundFile(sink, "w", sr, channels, format=output_format.container,
+                      subtype=output_format.subtype) as sound_file:
+        for block in blocks:
+            sound_file.write(block.T)
+            data = take()
+            if data:
+                yield data
+    data = take()
+    if data:
+        yield data
+
+
+def encode_stream(blocks, sr, frames, output_format="wav", channels=1):
+    # Yield the encoded file piece by piece as the blocks come in, so encoding overlaps with sending
+    if OUTPUT_FORMATS[output_format].container == "WAV":
+        return stream_wav(blocks, sr, frames, channels, OUTPUT_FORMATS[output_format].subtype)
+    return _stream_sound_file(blocks, sr, frames, OUTPUT_FORMATS[output_format], channels)
+
+
+def encode_audio(audio_data, sr, output_format="wav"):
+    # The whole file at once, through the same encoder as the streamed path (Ogg streams still differ in
+    # their random serial number)
+    channels = audio_data.shape[0] if audio_data.ndim > 1 else 1
+    return b"".join(encode_stream(array_blocks(audio_data), sr, audio_data.shape[-1], output_format, channels))
+
+
+def encode_output(audio_data, sr, output_format="wav", output_sample_rate=None):
+    # Resample to the rate the format is encoded at, then encode the whole file
+    target_sr = encoded_rate(output_format, sr, output_sample_rate)
+    return encode_audio(resample_to(audio_data, sr, target_sr), target_sr, output_format)
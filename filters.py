@@ -0,0 +1,59 @@
+from functools import lru_cache
+
+import numpy as np
+from scipy.signal import butter, sosfilt
+
+# Butterworth designs used by the presets: name -> (order, cutoff in Hz, btype)
+FILTER_PRESETS = {
+    "telephone": (10, (300.0, 3400.0), "band"),
+    "underwater": (10, (300.0, 600.0), "band"),
+    "radio": (10, (300.0, 3000.0), "band"),
+    "megaphone": (10, (500.0, 5000.0), "band"),
+    "deep_sea": (10, 200.0, "low"),
+    "radio_announcer": (10, (100.0, 5000.0), "band"),
+}
+
+
+@lru_cache(maxsize=256)
+def design_sos(order, cutoff, btype, sr):
+    # Design a Butterworth SOS cascade once per (order, cutoff, btype, sample rate).
+    # The array is shared between callers and must not be modified.
+    return butter(order, cutoff, btype=btype, fs=sr, output='sos')
+
+
+def preset_sos(name, sr):
+    order, cutoff, btype = FILTER_PRESETS[name]
+    return design_sos(order, cutoff, btype, sr)
+
+
+def initial_state(sos, block_shape):
+    # Zero filter state for a block of the given shape; channels, if any, lead the sample axis
+    return np.zeros((sos.shape[0],) + tuple(block_shape[:-1]) + (2,))
+
+
+def apply_sos(sos, audio_data, zi=None):
+    # Filter the whole signal; when zi is given, return (filtered, final state) so filtering can resume
+    if zi is None:
+        return sosfilt(sos, audio_data)
+    return sosfilt(sos, audio_data, zi=zi)
+
+
+class SosFilter:
+    # An SOS cascade plus its running state, for filtering a signal block by block
+
+    def __init__(self, sos):
+        self.sos = sos
+        self.zi = None
+
+    @classmethod
+    def from_preset(cls, name, sr):
+        return cls(preset_sos(name, sr))
+
+    def process(self, block):
+        if self.zi is None:
+            self.zi = initial_state(self.sos, block.shape)
+        filtered, self.zi = apply_sos(self.sos, block, zi=self.zi)
+        return filtered
+
+    def reset(self):
+        self.zi = None
@@ -0,0 +1,46 @@
+import numpy as np
+
+# Grain length of the granular pitch shifter in seconds, which is also the most it delays the signal
+GRAIN_TIME = 0.04
+
+
+class GrainShifter:
+    # Time-domain pitch shifter. Two read taps run through a delay line at `ratio` times the speed it
+    # is written, and jump back by one grain whenever they reach its end. The taps are half a grain
+    # apart and each is faded out around its jump with a sin^2 window, so the two windows always sum
+    # to one. Nothing more than one grain old is read, so it runs causally block by block with the
+    # state carried over, and rendering in blocks gives exactly the same output as one pass.
+
+    def __init__(self, sr, semitones, grain_time=GRAIN_TIME):
+        self.ratio = 2.0 ** (semitones / 12)
+        self.grain = max(int(grain_time * sr), 2)
+        self.position = 0
+        self.history = None
+
+    def _tap(self, buffer, n, delay):
+        # Linear interpolation at the absolute positions n - delay; buffer[0] is sample position - span
+        read = n - delay
+        index = np.floor(read).astype(np.int64)
+        frac = read - index
+        local = index - (self.position - buffer.shape[-1] + len(n))
+        following = np.minimum(local + 1, buffer.shape[-1] - 1)
+        return buffer[..., local] * (1 - frac) + buffer[..., following] * frac
+
+    def process(self, block):
+        span = self.grain + 1
+        if self.history is None:
+            self.history = np.zeros(block.shape[:-1] + (span,), dtype=block.dtype)
+        buffer = np.concatenate([self.history, block], axis=-1)
+        n = self.position + np.arange(block.shape[-1], dtype=np.float64)
+        # The delay of each tap changes by (1 - ratio) per sample and wraps around within [0, grain)
+        delay = np.mod((1 - self.ratio) * n, self.grain)
+        weight = np.sin(np.pi * delay / self.grain) ** 2
+        shifted = (weight * self._tap(buffer, n, delay)
+                   + (1 - weight) * self._tap(buffer, n, np.mod(delay + self.grain / 2, self.grain)))
+        self.history = buffer[..., buffer.shape[-1] - span:]
+        self.position += block.shape[-1]
+        return shifted.astype(block.dtype, copy=False)
+
+
+def granular_pitch_shift(audio_data, sr, semitones, grain_time=GRAIN_TIME):
+    return GrainShifter(sr, semitones, grain_time).process(audio_data)
@@ -0,0 +1,77 @@
+import soundfile as sf
+
+from audio_io import window_frames
+from config import MAX_PROCESSING_SR, MAX_UPLOAD_BYTES, MAX_UPLOAD_SECONDS, OVERLONG_UPLOADS
+
+OVERLONG_POLICIES = ["reject", "trim"]
+# Uploads whose header cannot be read are assumed to be compressed at this rate, to guess their length
+UNPROBED_BYTES_PER_SECOND = 16000
+UNPROBED_SR = 44100
+# Channels assumed for such uploads when their channels are kept
+UNPROBED_CHANNELS = 2
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+def check_upload_size(size, max_bytes=MAX_UPLOAD_BYTES):
+    if max_bytes and size > max_bytes:
+        raise UploadTooLarge(f"The upload is {size} bytes; at most {max_bytes} bytes are accepted")
+
+
+def probe_upload(file_obj):
+    # (sample rate, frames, channels) read from the container header without decoding any audio, or None
+    # when libsndfile cannot open the upload and its length is only known once it is decoded
+    file_obj.seek(0)
+    try:
+        with sf.SoundFile(file_obj) as sound_file:
+            return sound_file.samplerate, sound_file.frames, sound_file.channels
+    except sf.LibsndfileError:
+        return None
+    finally:
+        file_obj.seek(0)
+
+
+def limit_window(probe, offset=0.0, duration=None, max_seconds=MAX_UPLOAD_SECONDS, policy=OVERLONG_UPLOADS):
+    # The (offset, duration) window to decode once the length limit is applied. Uploads that cannot
+    # be probed are always cut at the limit, since rejecting them would mean decoding them first.
+    if not max_seconds or (duration is not None and duration <= max_seconds):
+        return offset, duration
+    if probe is None:
+        return offset, max_seconds
+    sr, frames, _ = probe
+    start, stop = window_frames(sr, frames, offset, duration)
+    seconds = (stop - start) / sr
+    if seconds <= max_seconds:
+        return offset, duration
+    if policy == "trim":
+        return offset, max_seconds
+    raise UploadTooLarge(f"The upload is {seconds:.1f} s long; at most {max_seconds:g} s can be processed")
+
+
+def window_samples(probe, offset=0.0, duration=None, max_sr=MAX_PROCESSING_SR):
+    # Length of the decoded window at the processing rate, or None when the upload could not be probed
+    if probe is None:
+        return None
+    sr, frames, _ = probe
+    start, stop = window_frames(sr, frames, offset, duration)
+    if max_sr and sr > max_sr:
+        return (stop - start) * max_sr // sr
+    return stop - start
+
+
+def guess_samples(size, duration=None, max_sr=MAX_PROCESSING_SR):
+    # Length at the processing rate of an upload that could not be probed, guessed from its size
+    seconds = size / UNPROBED_BYTES_PER_SECOND
+    if duration is not None:
+        seconds = min(seconds, duration)
+    sr = min(UNPROBED_SR, max_sr) if max_sr else UNPROBED_SR
+    return int(seconds * sr)
+
+
+def upload_channels(probe, keep_channels=False):
+    # Channels the upload is processed with: one unless they are kept
+    if not keep_channels:
+        return 1
+    return UNPROBED_CHANNELS if probe is None else probe[2]
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+from config import JOB_QUEUE_SIZE, JOB_TTL_SECONDS, JOB_WORKERS, JOBS_DIR
+from metrics import RequestTiming
+from workers import run_blocking
+
+JOB_ID = re.compile(r"[0-9a-f]{32}")
+# Fields of a job record that are reported to clients
+PUBLIC_FIELDS = ("id", "status", "stage", "progress", "created", "started", "finished", "expires", "error")
+
+
+class JobStore:
+    # Jobs on the local filesystem, one directory each: the upload, a job.json record and, once the job
+    # is done, the result. Records are replaced atomically, so readers never see a partial one.
+
+    def __init__(self, directory=JOBS_DIR, ttl=JOB_TTL_SECONDS):
+        self.directory = directory
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def _path(self, job_id, name=""):
+        return os.path.join(self.directory, job_id, name)
+
+    def upload_path(self, job_id):
+        return self._path(job_id, "upload")
+
+    def result_path(self, job_id):
+        return self._path(job_id, "result")
+
+    def _write(self, job):
+        with tempfile.NamedTemporaryFile("w", dir=self._path(job["id"]), prefix=".", delete=False) as temp_file:
+            json.dump(job, temp_file)
+        os.replace(temp_file.name, self._path(job["id"], "job.json"))
+
+    def _read(self, job_id):
+        try:
+            with open(self._path(job_id, "job.json")) as job_file:
+                return json.load(job_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def create(self, file_obj, **fields):
+        # Copy the upload into a new job directory and return the queued job's record
+        job = {"id": uuid.uuid4().hex, "status": "queued", "stage": None, "progress": 0.0, "created": time.time(),
+               "started": None, "finished": None, "expires": None, "error": None, **fields}
+        os.makedirs(self._path(job["id"]))
+        file_obj.seek(0)
+        with open(self.upload_path(job["id"]), "wb") as upload_file:
+            shutil.copyfileobj(file_obj, upload_file)
+        file_obj.seek(0)
+        self._write(job)
+        return job
+
+    def get(self, job_id):
+        # The job's record, or None for unknown and expired jobs
+        if not JOB_ID.fullmatch(job_id):
+            return None
+        job = self._read(job_id)
+        if job is not None and job["expires"] is not None and job["expires"] < time.time():
+            self.delete(job_id)
+            return None
+        return job
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._read(job_id)
+            if job is None:
+                return None
+            job.update(fields)
+            if fields.get("status") in ("done", "failed"):
+                job["finished"] = time.time()
+                job["expires"] = job["finished"] + self.ttl
+            self._write(job)
+            return job
+
+    def finish(self, job_id, data):
+        with open(self.result_path(job_id), "wb") as result_file:
+            result_file.write(data)
+        # The upload is not needed any more
+        os.remove(self.upload_path(job_id))
+        return self.update(job_id, status="done", stage=None, progress=1.0)
+
+    def fail(self, job_id, error):
+        if os.path.exists(self.upload_path(job_id)):
+            os.remove(self.upload_path(job_id))
+        return self.update(job_id, status="failed", stage=None, error=error)
+
+    def delete(self, job_id):
+        shutil.rmtree(self._path(job_id), ignore_errors=True)
+
+    def jobs(self):
+        if not os.path.isdir(self.directory):
+            return
+        for job_id in os.listdir(self.directory):
+            if JOB_ID.fullmatch(job_id):
+                yield job_id
+
+    def expire(self):
+        # Remove the jobs whose results have outlived the TTL
+        for job_id in list(self.jobs()):
+            self.get(job_id)
+
+    def recover(self):
+        # Jobs left unfinished by a previous server process will not run any more
+        for job_id in list(self.jobs()):
+            job = self._read(job_id)
+            if job is not None and job["status"] in ("queued", "running"):
+                self.fail(job_id, "Interrupted by a server restart")
+
+
+class JobTiming(RequestTiming):
+    # Request timing of a job's render that also reports each stage as the job's progress. `weights`
+    # gives the share of the estimated work done by each stage.
+
+    def __init__(self, store, job_id, weights, endpoint="job"):
+        super().__init__(endpoint)
+        self.store = store
+        self.job_id = job_id
+        self.weights = weights
+        self.progress = 0.0
+
+    @asynccontextmanager
+    async def stage(self, name):
+        await run_blocking(self.store.update, self.job_id, stage=name)
+        async with super().stage(name):
+            yield
+        self.progress = min(self.progress + self.weights.get(name, 0.0), 1.0)
+        await run_blocking(self.store.update, self.job_id, progress=round(self.progress, 3))
+
+
+class JobRunner:
+    # Runs submitted jobs in the background, at most `workers` at a time and in submission order
+
+    def __init__(self, store, workers=JOB_WORKERS, max_jobs=JOB_QUEUE_SIZE):
+        self.store = store
+        self.max_jobs = max_jobs
+        self._slots = asyncio.Semaphore(workers)
+        self._tasks = set()
+
+    def full(self):
+        return len(self._tasks) >= self.max_jobs
+
+    def submit(self, job_id, run):
+        # `run` is a coroutine function returning the encoded result
+        task = asyncio.create_task(self._run(job_id, run))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job_id, run):
+        async with self._slots:
+            await run_blocking(self.store.update, job_id, status="running", started=time.time())
+            try:
+                data = await run()
+            except Exception as e:
+                error = getattr(e, "detail", None) or str(e) or type(e).__name__
+                await run_blocking(self.store.fail, job_id, error)
+            else:
+                await run_blocking(self.store.finish, job_id, data)
+
+    def cancel(self):
+        for task in self._tasks:
+            task.cancel()
+
+
+def public_record(job):
+    record = {field: job[field] for field in PUBLIC_FIELDS}
+    if job["status"] == "done":
+        record["result"] = f"/jobs/{job['id']}/result"
+    return record
+
+
+job_store = JobStore()
+job_runner = JobRunner(job_store)
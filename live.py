@@ -0,0 +1,85 @@
+import sys
+import time
+
+import numpy as np
+
+from config import LIVE_MAX_FRAME_MS, LIVE_MAX_LATENCY_MS
+from presets import PRESETS
+from streaming import background_effect_chain, encode_pcm16, needs_whole_file, streaming_chain
+
+SAMPLE_FORMATS = {"s16": np.dtype("<i2"), "f32": np.dtype("<f4")}
+OVERRUN_POLICIES = ["flag", "drop"]
+# A live stream has no known end; pointwise stages only use the length for fade-outs
+OPEN_ENDED = sys.maxsize
+
+
+def live_presets(pitch_engine="phase_vocoder"):
+    # Presets whose whole chain runs causally block by block
+    return [name for name in PRESETS if not needs_whole_file(name, pitch_engine)]
+
+
+class LiveSession:
+    # Processes one live stream frame by frame with the streaming block processors, so filter, delay
+    # and LFO state carries over between frames exactly as in the streamed file render
+
+    def __init__(self, processors, sr, sample_format="s16", max_latency_ms=LIVE_MAX_LATENCY_MS,
+                 on_overrun="flag"):
+        self.processors = processors
+        self.sr = sr
+        self.dtype = SAMPLE_FORMATS[sample_format]
+        self.sample_format = sample_format
+        self.max_latency = max_latency_ms / 1000
+        self.on_overrun = on_overrun
+        self.max_frame_samples = int(sr * LIVE_MAX_FRAME_MS / 1000)
+        self.frames = 0
+        self.dropped = 0
+        self.late = 0
+
+    @classmethod
+    def for_preset(cls, category_name, sr, seed=None, pitch_engine="phase_vocoder", **options):
+        return cls(streaming_chain(category_name, sr, OPEN_ENDED, seed, pitch_engine), sr, **options)
+
+    @classmethod
+    def for_background(cls, effect_name, sr, factor, **options):
+        return cls(background_effect_chain(sr, OPEN_ENDED, effect_name, 0, factor), sr, **options)
+
+    def decode(self, data):
+        if len(data) % self.dtype.itemsize:
+            raise ValueError(f"Frame size must be a multiple of {self.dtype.itemsize} bytes")
+        frame = np.frombuffer(data, dtype=self.dtype)
+        if len(frame) > self.max_frame_samples:
+            raise ValueError(f"Frames may be at most {self.max_frame_samples} samples")
+        if self.sample_format == "s16":
+            # Same scaling libsndfile uses when reading 16-bit PCM as float
+            return frame.astype(np.float32) / 32768
+        return frame.astype(np.float32)
+
+    def encode(self, frame):
+        if self.sample_format == "s16":
+            return encode_pcm16(frame)
+        return np.asarray(frame, dtype=self.dtype).tobytes()
+
+    def process(self, data, received):
+        # Returns (output bytes, report). `received` is the perf_counter time the frame arrived; a frame
+        # that waited longer than the latency bound is flagged late, or replaced with silence and not
+        # processed when the policy is "drop", which lets the session catch up with real time.
+        frame = self.decode(data)
+        index = self.frames
+        self.frames += 1
+        waited = time.perf_counter() - received
+        overrun = waited > self.max_latency
+        if overrun and self.on_overrun == "drop":
+            self.dropped += 1
+            output = self.encode(np.zeros(len(frame), dtype=np.float32))
+            return output, {"frame": index, "samples": len(frame), "processing_ms": 0.0,
+                            "latency_ms": waited * 1000, "dropped": True, "late": True}
+        start = time.perf_counter()
+        for processor in self.processors:
+            frame = processor.process(frame)
+        output = self.encode(frame)
+        finished = time.perf_counter()
+        if overrun or finished - received > self.max_latency:
+            self.late += 1
+            overrun = True
+        return output, {"frame": index, "samples": len(frame), "processing_ms": (finished - start) * 1000,
+                        "latency_ms": (finished - received) * 1000, "dropped": False, "late": overrun}
@@ -1,86 +1,717 @@
+import asyncio
+import functools
 import io
 import os
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from starlette.responses import FileResponse, StreamingResponse
+import time
+import zipfile
+from typing import List
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, WebSocket, WebSocketDisconnect
+from starlette.formparsers import MultiPartParser
+from starlette.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from admission import Overloaded, admission
+from audio_io import decode_audio_file, file_size
 from effects import *
+from config import LIVE_MAX_LATENCY_MS, MAX_UPLOAD_BYTES, STREAM_BLOCK_SIZE, UPLOAD_SPOOL_BYTES
+from encoding import OUTPUT_FORMATS, check_output_rate, encode_output, encode_stream, encoded_rate, negotiate_format
+from jobs import JobTiming, job_runner, job_store, public_record
+from ingest import (UploadTooLarge, check_upload_size, guess_samples, limit_window, probe_upload, upload_channels,
+                    window_samples)
+from live import OVERRUN_POLICIES, SAMPLE_FORMATS, LiveSession, live_presets
+from metrics import (BYTES_PROCESSED, IN_FLIGHT, LIVE_FRAME_SECONDS, LIVE_FRAMES, UPLOADS_REJECTED, RequestTiming,
+                     render_metrics)
+from sound_cache import prewarm
+from presets import (PITCH_ENGINES, RATE_MODES, REDUCED_RATE_PRESETS, effect_functions, effective_pitch_engine,
+                     estimate_cost, estimate_peak_memory, estimate_stages_cost, is_deterministic, is_gil_bound,
+                     output_rate, preset_stages, preset_tree, render_branches, render_reduced)
+from result_cache import cached_result, lookup, result_key, store, store_stream, upload_hash
+from streaming import background_effect_chain, needs_whole_file, open_blocks, process_blocks, streaming_chain
+from workers import run_blocking, run_effect, shutdown_workers
 
 from effects_sounds import *
 
 app = FastAPI()
 
+render_modes = ["full", "stream"]
+timed_endpoints = ["/voice_changer", "/voice_changer/batch", "/voice_effect", "/jobs"]
+# Bytes per input sample a background effect holds at its peak: the input, the mixed-in sound, the mix
+# and the encoded output
+OVERLAY_MEMORY = 20
+
+# Uploads over this size go to a temporary file instead of staying in memory
+MultiPartParser.spool_max_size = UPLOAD_SPOOL_BYTES
+
+
+@app.on_event("startup")
+def prewarm_overlay_cache():
+    # Decode the background sounds once for the common sample rates
+    prewarm()
+
+
+@app.on_event("startup")
+def recover_jobs():
+    job_store.recover()
+
+
+@app.on_event("shutdown")
+def stop_workers():
+    job_runner.cancel()
+    shutdown_workers()
+
+
+@app.middleware("http")
+async def track_request(request: Request, call_next):
+    # Count in-flight requests and time the response body; handlers record their own stages
+    endpoint = request.url.path
+    if endpoint not in timed_endpoints:
+        return await call_next(request)
+    # A body declared over the limit is refused before any of it is read
+    length = request.headers.get("content-length")
+    if MAX_UPLOAD_BYTES and length and length.isdigit() and int(length) > MAX_UPLOAD_BYTES:
+        UPLOADS_REJECTED.inc(endpoint=endpoint, reason="size")
+        return JSONResponse({"detail": f"Request bodies may be at most {MAX_UPLOAD_BYTES} bytes"}, status_code=413)
+    timing = request.state.timing = RequestTiming(endpoint)
+    IN_FLIGHT.inc(endpoint=endpoint)
+    try:
+        response = await call_next(request)
+    except BaseException:
+        # Including cancellation when the client goes away while the handler runs
+        IN_FLIGHT.dec(endpoint=endpoint)
+        release_admission(request)
+        timing.finish(500)
+        raise
+    body = response.body_iterator
+    finished = False
+
+    def finish():
+        nonlocal finished
+        if not finished:
+            finished = True
+            timing.finish(response.status_code)
+            IN_FLIGHT.dec(endpoint=endpoint)
+            release_admission(request)
+
+    async def timed_body():
+        sent = 0
+        start = time.perf_counter()
+        try:
+            async for chunk in body:
+                sent += len(chunk)
+                yield chunk
+        finally:
+            timing.record("response", time.perf_counter() - start)
+            BYTES_PROCESSED.inc(sent, endpoint=endpoint, direction="out")
+            finish()
+
+    async def send_response(scope, receive, send):
+        # A body that is never started never runs its finally, for example when the client goes away
+        # before the first chunk, so the request is finished here as well
+        try:
+            await response(scope, receive, send)
+        finally:
+            finish()
+
+    response.body_iterator = timed_body()
+    return send_response
+
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+def start_timing(request, audio_file, preset):
+    # The time between the request arriving and the handler running is spent receiving the upload
+    timing = request.state.timing
+    timing.preset = preset
+    timing.record("upload", time.perf_counter() - timing.started)
+    BYTES_PROCESSED.inc(file_size(audio_file.file), endpoint=timing.endpoint, direction="in")
+    return timing
+
+
+def response_headers(timing):
+    headers = {"Server-Timing": timing.server_timing()}
+    if timing.memory_estimate is not None:
+        headers["X-Memory-Estimate"] = str(timing.memory_estimate)
+    return headers
+
+
+def audio_response(content, timing, cache=None, output_format="wav"):
+    headers = response_headers(timing)
+    if cache is not None:
+        headers["X-Cache"] = cache
+    return StreamingResponse(content, media_type=OUTPUT_FORMATS[output_format].media_type, headers=headers)
+
+
+async def cache_key(timing, audio_file, endpoint, name, **params):
+    async with timing.stage("hash"):
+        digest = await run_blocking(upload_hash, audio_file.file)
+    return result_key(digest, endpoint, name, **params)
+
+
+async def cached_response(key, timing, output_format="wav"):
+    # A response for an earlier identical request, or None
+    if key is None:
+        return None
+    data, tier = await run_blocking(lookup, key)
+    if data is None:
+        return None
+    return audio_response([data], timing, tier, output_format)
+
+
+async def render_response(key, render, timing, output_format="wav"):
+    # Render once per key: identical requests arriving meanwhile wait for the same result
+    if key is None:
+        return audio_response([await render()], timing, output_format=output_format)
+    data, source = await cached_result(key, render)
+    return audio_response([data], timing, source, output_format)
 
-@app.post("/voice_changer")
-async def upload_audio(audio_file: UploadFile = File(...), category_name: str = Form(...)):
-    available_categories = [" ,".join(effect_functions.keys())]
 
+def check_window(offset, duration):
+    if offset < 0 or (duration is not None and duration <= 0):
+        raise HTTPException(status_code=400, detail="offset must be non-negative and duration positive")
+
+
+def check_seed(seed):
+    if seed is not None and seed < 0:
+        raise HTTPException(status_code=400, detail="seed must be non-negative")
+
+
+def check_frames(frames):
+    if frames == 0:
+        raise HTTPException(status_code=400, detail="The requested window contains no audio")
+
+
+async def admit_upload(timing, audio_file, offset=0.0, duration=None, keep_channels=False):
+    # Refuse uploads over the size limit, and read the container header so that uploads over the length
+    # limit are rejected or trimmed before anything is decoded. Returns the window to decode, the number
+    # of channels it is processed with and its samples over all of them at the processing rate (guessed
+    # from the size when the header could not be read).
+    try:
+        check_upload_size(file_size(audio_file.file))
+    except UploadTooLarge as e:
+        UPLOADS_REJECTED.inc(endpoint=timing.endpoint, reason="size")
+        raise HTTPException(status_code=413, detail=str(e))
+    async with timing.stage("probe"):
+        probe = await run_blocking(probe_upload, audio_file.file)
+    try:
+        offset, duration = limit_window(probe, offset, duration)
+    except UploadTooLarge as e:
+        UPLOADS_REJECTED.inc(endpoint=timing.endpoint, reason="duration")
+        raise HTTPException(status_code=413, detail=str(e))
+    samples = window_samples(probe, offset, duration)
+    if samples is None:
+        samples = guess_samples(file_size(audio_file.file), duration)
+    channels = upload_channels(probe, keep_channels)
+    return offset, duration, samples * channels, channels
+
+
+async def admit_request(request, timing, cost):
+    # Wait for admission control to let the render start; the slot is released once the response is sent
+    if getattr(request.state, "admitted", None) is not None:
+        return
+    try:
+        async with timing.stage("queue"):
+            await admission.acquire(cost, timing.memory_estimate or 0, timing.endpoint)
+    except Overloaded as e:
+        UPLOADS_REJECTED.inc(endpoint=timing.endpoint, reason="overloaded")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    request.state.admitted = (cost, timing.memory_estimate or 0)
+
+
+def admitted_render(request, timing, cost, render):
+    # Take the admission slot inside the render, so that identical requests joining it hold none
+    async def run():
+        await admit_request(request, timing, cost)
+        return await render()
+    return run
+
+
+def release_admission(request):
+    admitted = getattr(request.state, "admitted", None)
+    if admitted is not None:
+        admission.release(*admitted)
+        request.state.admitted = None
+
+
+def choose_output(request, output_format, output_sample_rate):
+    # The output_format field wins over the Accept header; returns (output format, output sample rate)
+    try:
+        output_format = negotiate_format(output_format, request.headers.get("accept"))
+        check_output_rate(output_format, output_sample_rate)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return output_format, output_sample_rate
+
+
+async def render_file(timing, audio_file, name, effect_function, *args, window=(0.0, None), output_sr=None,
+                      output=("wav", None), gil_bound=False, keep_channels=False, **kwargs):
+    # Decode the upload straight from its in-memory or spooled buffer, only within the requested window
+    async with timing.stage("decode"):
+        audio_data, sr = await run_blocking(decode_audio_file, audio_file.file, audio_file.filename, *window,
+                                            keep_channels=keep_channels)
+    check_frames(audio_data.shape[-1])
+    timing.describe_input(name, sr, audio_data.shape[-1])
+    # Apply the chosen effect off the event loop
+    async with timing.stage("effect"):
+        processed_audio = await run_effect(effect_function, audio_data, sr, *args, gil_bound=gil_bound, **kwargs)
+    # Encode the processed audio, starting from the rate the effect renders to when it changes it
+    async with timing.stage("encode"):
+        return await run_blocking(encode_output, processed_audio, output_sr(sr) if output_sr else sr, *output)
+
+
+def check_category(category_name):
     if category_name not in effect_functions:
+        available_categories = [" ,".join(effect_functions.keys())]
         raise HTTPException(status_code=400,
                             detail=f"Invalid category. Available categories are: {available_categories}")
+
+
+def check_effect(effect_name):
+    directory = "./effects_sounds"
+    available_effects = [os.path.splitext(file)[0] for file in os.listdir(directory) if
+                         os.path.isfile(os.path.join(directory, file))]
+    if f'{effect_name}.wav' not in os.listdir(directory):
+        raise HTTPException(status_code=400, detail=f"Invalid effect. Available effects are: {available_effects}")
+
+
+def preset_render(timing, audio_file, category_name, window, output, rate_mode="native",
+                  pitch_engine="phase_vocoder", seed=None, keep_channels=False):
+    # The one-pass render of a preset, as a coroutine function; reduced-rate renders return at their own rate
+    if rate_mode == "native":
+        return functools.partial(render_file, timing, audio_file, category_name, effect_functions[category_name],
+                                 window=window, output=output, gil_bound=is_gil_bound(category_name, pitch_engine),
+                                 keep_channels=keep_channels, seed=seed, pitch_engine=pitch_engine)
+    return functools.partial(render_file, timing, audio_file, category_name,
+                             functools.partial(render_reduced, category_name), window=window,
+                             output_sr=functools.partial(output_rate, category_name, rate_mode=rate_mode),
+                             output=output, keep_channels=keep_channels, rate_mode=rate_mode, seed=seed)
+
+
+def effect_render(timing, audio_file, effect_name, window, output, effect_start, effect_strength,
+                  keep_channels=False):
+    return functools.partial(render_file, timing, audio_file, effect_name, apply_effect, effect_name,
+                             window=window, output=output, keep_channels=keep_channels, start_effect=effect_start,
+                             factor=effect_strength)
+
+
+def check_render_mode(render_mode):
+    if render_mode not in render_modes:
+        raise HTTPException(status_code=400, detail=f"Invalid render mode. Available modes are: {render_modes}")
+
+
+def check_rate_mode(rate_mode):
+    if rate_mode not in RATE_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid rate mode. Available modes are: {RATE_MODES}")
+
+
+def check_pitch_engine(pitch_engine):
+    if pitch_engine not in PITCH_ENGINES:
+        raise HTTPException(status_code=400,
+                            detail=f"Invalid pitch engine. Available engines are: {PITCH_ENGINES}")
+
+
+@app.post("/voice_changer")
+async def upload_audio(request: Request, audio_file: UploadFile = File(...), category_name: str = Form(...),
+                       render_mode: str = Form("full"), seed: int = Form(None), offset: float = Form(0.0),
+                       duration: float = Form(None), rate_mode: str = Form("native"),
+                       pitch_engine: str = Form("phase_vocoder"), output_format: str = Form(None),
+                       output_sample_rate: int = Form(None), keep_channels: bool = Form(False)):
+    check_category(category_name)
+    check_render_mode(render_mode)
+    check_rate_mode(rate_mode)
+    check_pitch_engine(pitch_engine)
+    check_window(offset, duration)
+    check_seed(seed)
+    # Only band-limited presets have a reduced-rate mode; the others ignore it
+    if category_name not in REDUCED_RATE_PRESETS:
+        rate_mode = "native"
+    pitch_engine = effective_pitch_engine(category_name, pitch_engine)
+    output_format, output_sample_rate = output = choose_output(request, output_format, output_sample_rate)
+    timing = start_timing(request, audio_file, category_name)
+    offset, duration, samples, channels = await admit_upload(timing, audio_file, offset, duration, keep_channels)
+    # Mono uploads render the same either way, so they share a cache entry
+    keep_channels = channels > 1
+    timing.memory_estimate = estimate_peak_memory([category_name], samples, pitch_engine)
     try:
-        # Read the uploaded audio into memory
-        audio_bytes = await audio_file.read()
-        temp_file_path = "audio_file.wav"
-        # Open the file in binary write mode
-        with open(temp_file_path, "wb") as audio_file:
-            # Write the audio bytes to the file
-            audio_file.write(audio_bytes)
-        # Load the audio from memory
-        audio_data, sr = load_audio(temp_file_path)
-        # Apply the chosen effect
-        effect_function = effect_functions[category_name]
-        processed_audio = effect_function(audio_data, sr)
-        # Convert the processed audio to bytes
-        output_bytes = io.BytesIO()
-        sf.write(output_bytes, processed_audio, sr, format='wav')
-        output_bytes.seek(0)
-        # Return the processed audio as a streaming response
-        return StreamingResponse(output_bytes, media_type="audio/wav")
+        # Presets with unseeded noise render differently every time, so they are never cached
+        key = None
+        if is_deterministic(category_name, seed):
+            key = await cache_key(timing, audio_file, "/voice_changer", category_name, seed=seed, offset=offset,
+                                  duration=duration, rate_mode=rate_mode, pitch_engine=pitch_engine,
+                                  output_format=output_format, output_sample_rate=output_sample_rate,
+                                  keep_channels=keep_channels)
+        cached = await cached_response(key, timing, output_format)
+        if cached is not None:
+            return cached
+        cost = estimate_cost([category_name], samples, pitch_engine)
+        if (render_mode == "stream" and rate_mode == "native"
+                and not needs_whole_file(category_name, pitch_engine)):
+            # Decode, process and encode block by block; the first bytes go out before the rest is decoded
+            await admit_request(request, timing, cost)
+            async with timing.stage("decode"):
+                sr, frames, channels, blocks = await run_blocking(open_blocks, audio_file.file, audio_file.filename,
+                                                                  offset=offset, duration=duration,
+                                                                  keep_channels=keep_channels)
+            check_frames(frames)
+            # Output that has to be resampled first (a requested rate, or Opus from a 44.1 kHz upload) is
+            # rendered in one pass below; the unused block generator closes the upload's decoder
+            if encoded_rate(output_format, sr, output_sample_rate) == sr:
+                timing.describe_input(category_name, sr, frames)
+                # Only a block at a time is held
+                timing.memory_estimate = estimate_peak_memory(
+                    [category_name], min(samples, STREAM_BLOCK_SIZE * channels), pitch_engine)
+                processors = streaming_chain(category_name, sr, frames, seed, pitch_engine)
+                chunks = encode_stream(process_blocks(blocks, processors), sr, frames, output_format, channels)
+                if key is not None:
+                    chunks = store_stream(key, chunks)
+                return audio_response(chunks, timing, None if key is None else "miss", output_format)
+            del blocks
+        # Effects that need the whole file, and reduced-rate renders, run in one pass in either render mode
+        render = preset_render(timing, audio_file, category_name, (offset, duration), output, rate_mode,
+                               pitch_engine, seed, keep_channels)
+        return await render_response(key, admitted_render(request, timing, cost, render), timing, output_format)
+    except HTTPException:
+        raise  # Reraise HTTPException for specific error handling
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to process audio file: {e}")
+
+
+def encode_zip(files, extension="wav"):
+    # Audio data barely compresses, so the archive is stored rather than deflated
+    output_bytes = io.BytesIO()
+    with zipfile.ZipFile(output_bytes, "w", zipfile.ZIP_STORED) as archive:
+        for name, data in files.items():
+            archive.writestr(f"{name}.{extension}", data)
+    output_bytes.seek(0)
+    return output_bytes
+
+
+async def render_tree(nodes, audio_data, sr, seed, results):
+    # Render a preset tree; every node runs once on its parent's output and sibling branches run
+    # concurrently, except that siblings starting with a spectral stage share one call (and one STFT)
+    async def render_nodes(group, parent):
+        outputs = await run_effect(render_branches, parent, [node.stages for node in group], sr, seed=seed,
+                                   gil_bound=any(node.gil_bound for node in group))
+        await asyncio.gather(*(finish_node(node, processed) for node, processed in zip(group, outputs)))
+
+    async def finish_node(node, processed):
+        results.update(dict.fromkeys(node.names, processed))
+        await render_tree(node.children, processed, sr, seed, results)
+
+    spectral = [node for node in nodes if node.spectral]
+    groups = [[node] for node in nodes if not node.spectral] + ([spectral] if spectral else [])
+    await asyncio.gather(*(render_nodes(group, audio_data) for group in groups))
+    return results
+
+
+@app.post("/voice_changer/batch")
+async def upload_audio(request: Request, audio_file: UploadFile = File(...),
+                       category_names: List[str] = Form(...), seed: int = Form(None), offset: float = Form(0.0),
+                       duration: float = Form(None), pitch_engine: str = Form("phase_vocoder"),
+                       output_format: str = Form(None), output_sample_rate: int = Form(None),
+                       keep_channels: bool = Form(False)):
+    # Categories may be sent as repeated fields or comma-separated
+    categories = list(dict.fromkeys(name.strip() for names in category_names for name in names.split(",")
+                                    if name.strip()))
+    invalid = [name for name in categories if name not in effect_functions]
+    if invalid:
+        raise HTTPException(status_code=400,
+                            detail=f"Invalid categories {invalid}. Available categories are: "
+                                   f"{list(effect_functions.keys())}")
+
+    check_pitch_engine(pitch_engine)
+    check_window(offset, duration)
+    check_seed(seed)
+    output_format, output_sample_rate = output = choose_output(request, output_format, output_sample_rate)
+    timing = start_timing(request, audio_file, "batch")
+    offset, duration, samples, channels = await admit_upload(timing, audio_file, offset, duration, keep_channels)
+    keep_channels = channels > 1
+    timing.memory_estimate = estimate_peak_memory(categories, samples, pitch_engine)
+    try:
+        # Results are cached under the same keys as single /voice_changer requests
+        async with timing.stage("hash"):
+            digest = await run_blocking(upload_hash, audio_file.file)
+        keys = {name: result_key(digest, "/voice_changer", name, seed=seed, offset=offset, duration=duration,
+                                 rate_mode="native", pitch_engine=effective_pitch_engine(name, pitch_engine),
+                                 output_format=output_format, output_sample_rate=output_sample_rate,
+                                 keep_channels=keep_channels)
+                for name in categories if is_deterministic(name, seed)}
+        files = {}
+        for name, key in keys.items():
+            data, _ = await run_blocking(lookup, key)
+            if data is not None:
+                files[name] = data
+        missing = [name for name in categories if name not in files]
+        if missing:
+            await admit_request(request, timing, estimate_cost(missing, samples, pitch_engine))
+            async with timing.stage("decode"):
+                audio_data, sr = await run_blocking(decode_audio_file, audio_file.file, audio_file.filename,
+                                                    offset, duration, keep_channels=keep_channels)
+            check_frames(audio_data.shape[-1])
+            timing.describe_input("batch", sr, audio_data.shape[-1])
+            # Presets sharing leading stages share their intermediate results
+            async with timing.stage("effect"):
+                rendered = await render_tree(preset_tree(missing, pitch_engine), audio_data, sr, seed, {})
+            async with timing.stage("encode"):
+                for name in missing:
+                    files[name] = await run_blocking(encode_output, rendered[name], sr, *output)
+                    if name in keys:
+                        await run_blocking(store, keys[name], files[name])
+        archive = await run_blocking(encode_zip, {name: files[name] for name in categories},
+                                     OUTPUT_FORMATS[output_format].extension)
+        headers = response_headers(timing)
+        headers["Content-Disposition"] = 'attachment; filename="voices.zip"'
+        return StreamingResponse(archive, media_type="application/zip", headers=headers)
     except HTTPException:
         raise  # Reraise HTTPException for specific error handling
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to process audio file: {e}")
-    finally:
-        # Clean up temporary files
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
 
 
 @app.post("/voice_effect")
 async def upload_audio(
+        request: Request,
         audio_file: UploadFile = File(...),
         effect_name: str = Form(...),
-        effect_start: int = Form(...), effect_strength: int = Form(3)):
-    directory = "./effects_sounds"
-    available_effects = [os.path.splitext(file)[0] for file in os.listdir(directory) if
-                         os.path.isfile(os.path.join(directory, file))]
-    if f'{effect_name}.wav' not in os.listdir(directory):
-        raise HTTPException(status_code=400, detail=f"Invalid effect. Available effects are: {available_effects}")
-
+        effect_start: int = Form(...), effect_strength: int = Form(3),
+        render_mode: str = Form("full"), output_format: str = Form(None), output_sample_rate: int = Form(None),
+        keep_channels: bool = Form(False)):
+    check_effect(effect_name)
+    check_render_mode(render_mode)
+    output_format, output_sample_rate = output = choose_output(request, output_format, output_sample_rate)
+    timing = start_timing(request, audio_file, effect_name)
+    offset, duration, samples, channels = await admit_upload(timing, audio_file, keep_channels=keep_channels)
+    keep_channels = channels > 1
+    timing.memory_estimate = OVERLAY_MEMORY * samples
     try:
-        # Read the uploaded audio into memory
-        audio_bytes = await audio_file.read()
-        temp_file_path = "audio_file1.wav"
-
-        # Open the file in binary write mode
-        with open(temp_file_path, "wb") as audio_file:
-            audio_file.write(audio_bytes)
-
-        audio_data, sr = load_audio(temp_file_path)
-
-        # Apply the chosen effect
-        # effect_function = voice_effect_functions[effect]
-        processed_audio = apply_effect(audio_data, sr, effect_name, start_effect=effect_start, factor=effect_strength)
-        # Convert the processed audio to bytes
-
-        output_bytes = io.BytesIO()
-        sf.write(output_bytes, processed_audio, sr, format='wav')
-        output_bytes.seek(0)
-        # Return the processed audio as a streaming response
-        return StreamingResponse(output_bytes, media_type="audio/wav")
+        key = await cache_key(timing, audio_file, "/voice_effect", effect_name, start=effect_start,
+                              strength=effect_strength, duration=duration, output_format=output_format,
+                              output_sample_rate=output_sample_rate, keep_channels=keep_channels)
+        cached = await cached_response(key, timing, output_format)
+        if cached is not None:
+            return cached
+        cost = estimate_stages_cost([("overlay", {})], samples)
+        if render_mode == "stream":
+            await admit_request(request, timing, cost)
+            async with timing.stage("decode"):
+                sr, frames, channels, blocks = await run_blocking(open_blocks, audio_file.file, audio_file.filename,
+                                                                  duration=duration, keep_channels=keep_channels)
+            check_frames(frames)
+            if encoded_rate(output_format, sr, output_sample_rate) == sr:
+                timing.describe_input(effect_name, sr, frames)
+                timing.memory_estimate = OVERLAY_MEMORY * min(samples, STREAM_BLOCK_SIZE * channels)
+                processors = background_effect_chain(sr, frames, effect_name, effect_start,
+                                                     bg_effect_strength.get(effect_strength))
+                chunks = encode_stream(process_blocks(blocks, processors), sr, frames, output_format, channels)
+                return audio_response(store_stream(key, chunks), timing, "miss", output_format)
+            del blocks
+        render = effect_render(timing, audio_file, effect_name, (offset, duration), output, effect_start,
+                               effect_strength, keep_channels)
+        return await render_response(key, admitted_render(request, timing, cost, render), timing, output_format)
     except HTTPException:
         raise  # Reraise HTTPException for specific error handling
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to process audio file: {e}")
+
+
+async def run_job(job):
+    # Render a job as its endpoint would, sharing the result cache and the admission budget with it
+    name, params, samples = job["name"], job["params"], job["samples"]
+    output = (params["output_format"], params["output_sample_rate"])
+    if job["endpoint"] == "/voice_effect":
+        stages = [("overlay", {})]
+        memory = OVERLAY_MEMORY * samples
+        deterministic = True
+    else:
+        stages = preset_stages(name, params["pitch_engine"])
+        memory = estimate_peak_memory([name], samples, params["pitch_engine"])
+        deterministic = is_deterministic(name, params["seed"])
+    # Decoding and encoding each take the estimated cost of one pass over the audio, the effect the rest
+    share = estimate_stages_cost([], 1) / 2 / estimate_stages_cost(stages, 1)
+    timing = JobTiming(job_store, job["id"], {"decode": share, "effect": 1 - 2 * share, "encode": share})
+    timing.preset = name
+    timing.memory_estimate = memory
+    cost = estimate_stages_cost(stages, samples)
+    status = 500
+    try:
+        with await run_blocking(open, job_store.upload_path(job["id"]), "rb") as file_obj:
+            audio_file = UploadFile(file_obj, filename=job["filename"])
+            if job["endpoint"] == "/voice_effect":
+                render = effect_render(timing, audio_file, name, (0.0, params["duration"]), output, params["start"],
+                                       params["strength"], params["keep_channels"])
+            else:
+                render = preset_render(timing, audio_file, name, (params["offset"], params["duration"]), output,
+                                       params["rate_mode"], params["pitch_engine"], params["seed"],
+                                       params["keep_channels"])
+            # Jobs are already queued by the job runner, so they wait for admission however long the line
+            async with timing.stage("queue"):
+                await admission.acquire(cost, memory, timing.endpoint, bounded=False)
+            try:
+                if deterministic:
+                    data, _ = await cached_result(result_key(job["digest"], job["endpoint"], name, **params), render)
+                else:
+                    data = await render()
+            finally:
+                admission.release(cost, memory)
+        status = 200
+        return data
+    finally:
+        timing.finish(status)
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: Request, audio_file: UploadFile = File(...), category_name: str = Form(None),
+                     effect_name: str = Form(None), seed: int = Form(None), offset: float = Form(0.0),
+                     duration: float = Form(None), rate_mode: str = Form("native"),
+                     pitch_engine: str = Form("phase_vocoder"), effect_start: int = Form(None),
+                     effect_strength: int = Form(3), output_format: str = Form(None),
+                     output_sample_rate: int = Form(None), keep_channels: bool = Form(False)):
+    # Render a /voice_changer (category_name) or /voice_effect (effect_name) request in the background.
+    # The job id is polled at /jobs/{id} and the output downloaded from /jobs/{id}/result.
+    if (category_name is None) == (effect_name is None):
+        raise HTTPException(status_code=400, detail="Give exactly one of category_name and effect_name")
+    if category_name is not None:
+        check_category(category_name)
+        check_rate_mode(rate_mode)
+        check_pitch_engine(pitch_engine)
+        check_window(offset, duration)
+        check_seed(seed)
+        if category_name not in REDUCED_RATE_PRESETS:
+            rate_mode = "native"
+        pitch_engine = effective_pitch_engine(category_name, pitch_engine)
+    else:
+        check_effect(effect_name)
+        if effect_start is None:
+            raise HTTPException(status_code=400, detail="effect_start is required with effect_name")
+    output_format, output_sample_rate = choose_output(request, output_format, output_sample_rate)
+    name = category_name or effect_name
+    timing = start_timing(request, audio_file, name)
+    if job_runner.full():
+        UPLOADS_REJECTED.inc(endpoint=timing.endpoint, reason="overloaded")
+        raise HTTPException(status_code=429, detail="Too many unfinished jobs",
+                            headers={"Retry-After": str(admission.retry_after())})
+    # The same upload limits and cache keys as the synchronous endpoints
+    if category_name is not None:
+        offset, duration, samples, channels = await admit_upload(timing, audio_file, offset, duration, keep_channels)
+        endpoint = "/voice_changer"
+        params = {"seed": seed, "offset": offset, "duration": duration, "rate_mode": rate_mode,
+                  "pitch_engine": pitch_engine}
+    else:
+        _, duration, samples, channels = await admit_upload(timing, audio_file, keep_channels=keep_channels)
+        endpoint = "/voice_effect"
+        params = {"start": effect_start, "strength": effect_strength, "duration": duration}
+    params.update(output_format=output_format, output_sample_rate=output_sample_rate, keep_channels=channels > 1)
+    async with timing.stage("hash"):
+        digest = await run_blocking(upload_hash, audio_file.file)
+    await run_blocking(job_store.expire)
+    job = await run_blocking(job_store.create, audio_file.file, filename=audio_file.filename, endpoint=endpoint,
+                             name=name, params=params, digest=digest, samples=samples)
+    job_runner.submit(job["id"], functools.partial(run_job, job))
+    return JSONResponse(public_record(job), status_code=202, headers={"Location": f"/jobs/{job['id']}"})
+
+
+def find_job(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    return public_record(await run_blocking(find_job, job_id))
+
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    job = await run_blocking(find_job, job_id)
+    if job["status"] != "done":
+        detail = f"The job is {job['status']}" + (f": {job['error']}" if job["error"] else "")
+        raise HTTPException(status_code=409, detail=detail)
+    output_format = OUTPUT_FORMATS[job["params"]["output_format"]]
+    return FileResponse(job_store.result_path(job_id), media_type=output_format.media_type,
+                        filename=f"{job['name']}.{output_format.extension}")
+
+
+def open_live_session(sample_rate, category_name, effect_name, effect_strength, sample_format, max_latency_ms,
+                      on_overrun, seed, pitch_engine):
+    # Validate the query parameters of a live session; raises ValueError with a message for the client
+    if sample_rate <= 0:
+        raise ValueError("sample_rate must be positive")
+    if sample_format not in SAMPLE_FORMATS:
+        raise ValueError(f"Invalid sample format. Available formats are: {list(SAMPLE_FORMATS)}")
+    if on_overrun not in OVERRUN_POLICIES:
+        raise ValueError(f"Invalid overrun policy. Available policies are: {OVERRUN_POLICIES}")
+    options = {"sample_format": sample_format, "max_latency_ms": max_latency_ms, "on_overrun": on_overrun}
+    if (category_name is None) == (effect_name is None):
+        raise ValueError("Give exactly one of category_name and effect_name")
+    if pitch_engine not in PITCH_ENGINES:
+        raise ValueError(f"Invalid pitch engine. Available engines are: {PITCH_ENGINES}")
+    if seed is not None and seed < 0:
+        raise ValueError("seed must be non-negative")
+    if category_name is not None:
+        if category_name not in live_presets(pitch_engine):
+            raise ValueError(f"Invalid live category. Available categories are: {live_presets(pitch_engine)}")
+        return LiveSession.for_preset(category_name, sample_rate, seed, pitch_engine, **options)
+    if not os.path.isfile(os.path.join("./effects_sounds", f"{effect_name}.wav")):
+        raise ValueError("Invalid effect")
+    return LiveSession.for_background(effect_name, sample_rate, bg_effect_strength.get(effect_strength), **options)
+
+
+@app.websocket("/voice_changer/live")
+async def live_voice_changer(websocket: WebSocket, sample_rate: int, category_name: str = None,
+                             effect_name: str = None, effect_strength: int = 3, sample_format: str = "s16",
+                             max_latency_ms: int = LIVE_MAX_LATENCY_MS, on_overrun: str = "flag",
+                             seed: int = None, pitch_engine: str = "phase_vocoder"):
+    # Binary messages are PCM frames in, processed frames out; each output frame is followed by a JSON
+    # report. A text message "end" finishes the session with a summary.
+    endpoint = "/voice_changer/live"
+    preset = category_name or effect_name
+    await websocket.accept()
+    try:
+        session = open_live_session(sample_rate, category_name, effect_name, effect_strength, sample_format,
+                                    max_latency_ms, on_overrun, seed, pitch_engine)
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+
+    # Frames are received on their own task, so the time a frame waits behind slower ones is measured
+    frames = asyncio.Queue()
+
+    async def receive_frames():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is not None:
+                    await frames.put((message["bytes"], time.perf_counter()))
+                elif message.get("text") == "end":
+                    break
+        finally:
+            await frames.put(None)
+
+    receiver = asyncio.create_task(receive_frames())
+    IN_FLIGHT.inc(endpoint=endpoint)
+    try:
+        while (item := await frames.get()) is not None:
+            data, received = item
+            try:
+                output, report = await run_blocking(session.process, data, received)
+            except ValueError as e:
+                await websocket.close(code=1007, reason=str(e))
+                return
+            await websocket.send_bytes(output)
+            await websocket.send_json(report)
+            BYTES_PROCESSED.inc(len(data), endpoint=endpoint, direction="in")
+            BYTES_PROCESSED.inc(len(output), endpoint=endpoint, direction="out")
+            LIVE_FRAME_SECONDS.observe(report["processing_ms"] / 1000, preset=preset)
+            outcome = "dropped" if report["dropped"] else "late" if report["late"] else "on_time"
+            LIVE_FRAMES.inc(preset=preset, outcome=outcome)
+        await websocket.send_json({"frames": session.frames, "dropped": session.dropped, "late": session.late})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
     finally:
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
+        receiver.cancel()
+        IN_FLIGHT.dec(endpoint=endpoint)
@@ -0,0 +1,197 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import asynccontextmanager
+
+from result_cache import result_cache_stats
+from sound_cache import overlay_cache_stats
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Input durations are bucketed before being used as a label, to keep the number of series bounded
+DURATION_LABELS = ((10, "0-10s"), (30, "10-30s"), (120, "30-120s"), (600, "120-600s"))
+
+
+def duration_label(duration):
+    if duration is None:
+        return "unknown"
+    for limit, label in DURATION_LABELS:
+        if duration < limit:
+            return label
+    return "600s+"
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Metric:
+    # Base for the Prometheus-style metrics below; samples are keyed by their label values
+
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        # Label values are kept as strings so samples sort the same whatever types they were given as
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def _render_sample(self, key, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), counts):
+            cumulative += count
+            labels = _format_labels(self.labels + ("le",), key + (bound,))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labels, key)
+        lines.append(f"{self.name}_sum{labels} {total}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("voice_changer_stage_seconds", "Time spent in each request stage",
+                          labels=("endpoint", "preset", "stage", "sample_rate", "duration"))
+REQUEST_SECONDS = Histogram("voice_changer_request_seconds", "Total request time including the response body",
+                            labels=("endpoint", "preset", "status"))
+IN_FLIGHT = Gauge("voice_changer_requests_in_flight", "Requests currently being processed", labels=("endpoint",))
+BYTES_PROCESSED = Counter("voice_changer_bytes_total", "Audio bytes received and sent",
+                          labels=("endpoint", "direction"))
+AUDIO_SECONDS = Counter("voice_changer_audio_seconds_total", "Seconds of input audio processed",
+                        labels=("endpoint", "preset"))
+
+LIVE_FRAME_SECONDS = Histogram("voice_changer_live_frame_seconds", "Processing time of live frames",
+                               labels=("preset",), buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                                                            0.25, 0.5, 1.0))
+LIVE_FRAMES = Counter("voice_changer_live_frames_total", "Live frames by outcome (on_time, late, dropped)",
+                      labels=("preset", "outcome"))
+
+MEMORY_ESTIMATE_BYTES = Histogram("voice_changer_memory_estimate_bytes", "Estimated peak memory of each render",
+                                  labels=("endpoint",), buckets=tuple(2 ** power for power in range(20, 34)))
+UPLOADS_REJECTED = Counter("voice_changer_uploads_rejected_total",
+                           "Uploads refused by the upload limits (size, duration) or admission control (overloaded)",
+                           labels=("endpoint", "reason"))
+
+ADMISSION_QUEUE_DEPTH = Gauge("voice_changer_admission_queue_depth", "Requests waiting to be admitted")
+ADMISSION_WAIT_SECONDS = Histogram("voice_changer_admission_wait_seconds", "Time requests waited to be admitted",
+                                   labels=("endpoint",))
+ADMITTED_WORK_SECONDS = Gauge("voice_changer_admitted_work_seconds",
+                              "Estimated processing seconds of the requests admitted and running")
+
+REGISTRY = [STAGE_SECONDS, REQUEST_SECONDS, IN_FLIGHT, BYTES_PROCESSED, AUDIO_SECONDS, LIVE_FRAME_SECONDS,
+            LIVE_FRAMES, MEMORY_ESTIMATE_BYTES, UPLOADS_REJECTED, ADMISSION_QUEUE_DEPTH, ADMISSION_WAIT_SECONDS,
+            ADMITTED_WORK_SECONDS]
+
+
+def render_metrics():
+    # Prometheus text exposition format
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for cache, stats in (("overlay_cache", overlay_cache_stats()), ("result_cache", result_cache_stats())):
+        for counter, value in stats.items():
+            metric_name = f"voice_changer_{cache}_{counter}"
+            lines.extend([f"# TYPE {metric_name} gauge", f"{metric_name} {value}"])
+    return "\n".join(lines) + "\n"
+
+
+class RequestTiming:
+    # Per-request stage timings, reported in the Server-Timing header and the stage histogram
+
+    def __init__(self, endpoint, started=None):
+        self.endpoint = endpoint
+        self.started = time.perf_counter() if started is None else started
+        self.preset = ""
+        self.sr = None
+        self.duration = None
+        # Estimated peak memory of the render in bytes, once the upload has been probed
+        self.memory_estimate = None
+        self.stages = []
+
+    @asynccontextmanager
+    async def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        self.stages.append((name, seconds))
+
+    def describe_input(self, preset, sr, samples):
+        self.preset = preset
+        self.sr = sr
+        self.duration = samples / sr
+
+    def server_timing(self):
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages)
+
+    def finish(self, status):
+        labels = {"endpoint": self.endpoint, "preset": self.preset, "sample_rate": self.sr or "unknown",
+                  "duration": duration_label(self.duration)}
+        for name, seconds in self.stages:
+            STAGE_SECONDS.observe(seconds, stage=name, **labels)
+        REQUEST_SECONDS.observe(time.perf_counter() - self.started, endpoint=self.endpoint, preset=self.preset,
+                                status=status)
+        if self.duration is not None:
+            AUDIO_SECONDS.inc(self.duration, endpoint=self.endpoint, preset=self.preset)
+        if self.memory_estimate is not None:
+            MEMORY_ESTIMATE_BYTES.observe(self.memory_estimate, endpoint=self.endpoint)
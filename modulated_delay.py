@@ -0,0 +1,53 @@
+import numpy as np
+
+
+def lfo(length, sr, rate, voices=1, phase=0.0):
+    # Sine LFO; with several voices their phases are spread evenly over one cycle
+    t = np.arange(length) / sr
+    if voices == 1:
+        return np.sin(2 * np.pi * rate * t + phase)
+    phases = phase + 2 * np.pi * np.arange(voices) / voices
+    return np.sin(2 * np.pi * rate * t[np.newaxis, :] + phases[:, np.newaxis])
+
+
+def fractional_delay(audio_data, delay_samples):
+    # Read audio_data[n - delay_samples[n]] with linear interpolation between neighbouring samples.
+    # delay_samples may carry leading voice axes; reads outside the signal are silent.
+    length = audio_data.shape[-1]
+    positions = np.arange(length) - delay_samples
+    index = np.floor(positions).astype(np.int64)
+    frac = (positions - index).astype(audio_data.dtype)
+    valid = (index >= 0) & (index < length - 1)
+    index = np.where(valid, index, 0)
+    gathered = audio_data[..., index] * (1 - frac) + audio_data[..., index + 1] * frac
+    # The last sample has no right neighbour, so read it exactly
+    last = positions == length - 1
+    final = audio_data[..., -1:].reshape(audio_data.shape[:-1] + (1,) * positions.ndim)
+    gathered = np.where(valid, gathered, np.where(last, final, 0))
+    return gathered.astype(audio_data.dtype, copy=False)
+
+
+def modulated_delay(audio_data, sr, base_delay=0.0, depth=0.002, rate=1.0, voices=1, wet=1.0, dry=1.0, phase=0.0):
+    # Mix the dry signal with one or more copies read through an LFO-modulated delay line.
+    # Delay (seconds) = base_delay + depth * sin(2 * pi * rate * t + phase + voice phase).
+    modulator = lfo(audio_data.shape[-1], sr, rate, voices=voices, phase=phase)
+    delay_samples = sr * (base_delay + depth * modulator)
+    wet_audio = fractional_delay(audio_data, delay_samples)
+    if voices > 1:
+        # Voices sit just before the sample axis, after any channel axis
+        wet_audio = wet_audio.sum(axis=-2)
+    return dry * audio_data + wet * wet_audio
+
+
+def vibrato_depth(rate, semitones):
+    # Reading a delay line whose delay changes by v seconds per second plays it back at 1 - v times
+    # the pitch. A delay of depth * (1 + cos(2 pi rate t)) therefore gives the pitch ratio
+    # 1 + 2 pi rate depth * sin(2 pi rate t), which this depth makes peak at `semitones` up.
+    return (2.0 ** (semitones / 12) - 1) / (2 * np.pi * rate)
+
+
+def vibrato(audio_data, sr, rate=5.0, semitones=0.5):
+    # Sinusoidal pitch modulation of about +-semitones in one pass; the delay never goes below zero, so it is causal
+    depth = vibrato_depth(rate, semitones)
+    return modulated_delay(audio_data, sr, base_delay=depth, depth=depth, rate=rate, wet=1.0, dry=0.0,
+                           phase=np.pi / 2)
@@ -0,0 +1,44 @@
+from functools import lru_cache
+
+import numpy as np
+from scipy.signal import firwin, kaiserord, upfirdn
+
+# Stopband attenuation of the decimation filters, in dB
+STOPBAND_ATTENUATION = 60.0
+
+
+def decimation_factor(sr, passband_edge, min_rate):
+    # The largest integer factor that divides sr and keeps the reduced rate above both `min_rate`
+    # and 1.2 times the Nyquist rate of the passband
+    lowest = max(min_rate, 2.4 * passband_edge)
+    for factor in range(int(sr // lowest), 1, -1):
+        if sr % factor == 0:
+            return factor
+    return 1
+
+
+@lru_cache(maxsize=64)
+def design_decimator(sr, factor, passband_edge):
+    # Lowpass FIR for decimating by `factor` when only [0, passband_edge] has to survive: everything
+    # that would alias into the passband, i.e. above sr / factor - passband_edge, is removed. That
+    # transition band is much wider than a general-purpose resampler's, so the filter is short.
+    # The length is odd with a group delay that is a multiple of `factor`, so both directions can
+    # compensate it exactly. The array is shared between callers and must not be modified.
+    stopband_edge = sr / factor - passband_edge
+    taps, beta = kaiserord(STOPBAND_ATTENUATION, (stopband_edge - passband_edge) / (sr / 2))
+    half = -(-(taps // 2) // factor) * factor
+    return firwin(2 * half + 1, (passband_edge + stopband_edge) / 2, window=("kaiser", beta), fs=sr)
+
+
+def decimate(audio_data, factor, fir):
+    delay = (len(fir) - 1) // 2 // factor
+    length = -(-audio_data.shape[-1] // factor)
+    decimated = upfirdn(fir, audio_data, down=factor, axis=-1)[..., delay:delay + length]
+    return decimated.astype(audio_data.dtype, copy=False)
+
+
+def interpolate(audio_data, factor, fir, length):
+    # Upsample by `factor` back to `length` samples with the same filter, which also removes the images
+    delay = (len(fir) - 1) // 2
+    interpolated = upfirdn(fir * factor, audio_data, up=factor, axis=-1)[..., delay:delay + length]
+    return np.asarray(interpolated, dtype=audio_data.dtype)
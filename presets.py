@@ -0,0 +1,567 @@
+import functools
+import os
+from functools import lru_cache
+
+import librosa
+import numpy as np
+from scipy.signal import sosfilt
+
+import analysis
+import segments
+from config import EFFECTS_SOUNDS_DIR
+from delay_line import feedback_delay, feedforward_echo
+from effects import apply_flanger_voice, change_speed, pitch_and_speed, pitch_shift
+from filters import FILTER_PRESETS, preset_sos
+from granular import granular_pitch_shift
+from modulated_delay import modulated_delay, vibrato
+from multirate import decimate, decimation_factor, design_decimator, interpolate
+from segments import rearrange
+from sound_cache import load_overlay
+
+# Samples per block when a run of pointwise stages is applied in one fused pass
+FUSED_BLOCK_SIZE = 16384
+# Seeded noise is drawn in chunks aligned to absolute sample positions, so the same seed gives the
+# same noise however the signal is split into blocks
+NOISE_CHUNK_SIZE = 16384
+
+# Every preset is an ordered chain of (stage, parameters). Stages are either pointwise (the output
+# sample depends only on the input sample and its position) or whole-signal operations.
+PRESETS = {
+    "alien": [("pitch_and_speed", {"semitones": 12, "rate": 0.7}), ("overlay", {"sound": "robotwav"})],
+    "delay": [("feedback_delay", {"delay_time": 0.1, "feedback": 0.4})],
+    "chorus": [("chorus", {"depth": 0.03, "rate": 1.3})],
+    "pitch_shift": [("pitch_shift", {"semitones": 2})],
+    "increase_volume": [("gain", {"gain": 1.5})],
+    "change_speed": [("time_stretch", {"rate": 1.5})],
+    "echo": [("echo", {"delay_time": 0.5, "decay": 0.5})],
+    "reverb": [("preemphasis", {}), ("gain", {"gain": 0.7}), ("clip", {})],
+    "girl": [("pitch_and_speed", {"semitones": 12, "rate": 1.2}), ("fade", {"duration": 0.03})],
+    "child": [("pitch_shift", {"semitones": 7})],
+    "reversed": [("reverse", {})],
+    "male": [("pitch_shift", {"semitones": -3})],
+    "demon": [("pitch_shift", {"semitones": -12})],
+    "telephone": [("filter", {"name": "telephone"})],
+    "chipmunk": [("pitch_shift", {"semitones": 15})],
+    "slow_motion": [("pitch_and_speed", {"semitones": -5, "rate": 0.5})],
+    "distorted": [("gain", {"gain": 10}), ("clip", {})],
+    "underwater": [("filter", {"name": "underwater"})],
+    "haunted": [("preemphasis", {}), ("gain", {"gain": 0.9}), ("clip", {}),
+                ("echo", {"delay_time": 0.3, "decay": 0.8})],
+    "monster": [("pitch_shift", {"semitones": -9}), ("gain", {"gain": 10}), ("clip", {})],
+    "whisper": [("gain", {"gain": 0.2}), ("noise", {"level": 0.02})],
+    "radio": [("filter", {"name": "radio"}), ("noise", {"level": 0.01}), ("overlay", {"sound": "radio"})],
+    "strong_echo": [("echo", {"delay_time": 0.7, "decay": 0.7})],
+    "megaphone": [("filter", {"name": "megaphone"}), ("gain", {"gain": 5}), ("clip", {})],
+    "space": [("preemphasis", {}), ("gain", {"gain": 0.9}), ("clip", {}),
+              ("echo", {"delay_time": 0.5, "decay": 0.6})],
+    "deep": [("pitch_shift", {"semitones": -6}), ("gain", {"gain": 2}), ("clip", {})],
+    "tremolo": [("modulate", {"frequency": 5.0, "offset": 0.5, "depth": 0.5})],
+    "flanger": [("flanger", {})],
+    "stuttering": [("stutter", {"stutter_factor": 0.1})],
+    "broken_robot": [("pitch_and_speed", {"semitones": -4, "rate": 0.8}), ("gain", {"gain": 1.5}), ("clip", {})],
+    "slow_down": [("time_stretch", {"rate": 0.5})],
+    "cyborg": [("pitch_and_speed", {"semitones": -4, "rate": 0.8})],
+    "robot": [("harmonic", {}), ("pitch_shift", {"semitones": -3})],
+    "darth_vader": [("pitch_shift", {"semitones": -7}), ("preemphasis", {}), ("gain", {"gain": 0.7}), ("clip", {})],
+    "ghostly_whisper": [("pitch_shift", {"semitones": -5}), ("preemphasis", {}), ("gain", {"gain": 0.95}),
+                        ("clip", {})],
+    "cylon": [("pitch_and_speed", {"semitones": -6, "rate": 0.8}), ("modulate", {"frequency": 30})],
+    "witch": [("pitch_shift", {"semitones": -3}), ("echo", {"delay_time": 0.3, "decay": 0.6})],
+    "glitch": [("noise", {"level": 0.05})],
+    "breathy": [("gain", {"gain": 0.8}), ("noise", {"level": 0.05})],
+    "deep_sea": [("filter", {"name": "deep_sea"}), ("preemphasis", {}), ("gain", {"gain": 0.9}), ("clip", {})],
+    "cyberpune": [("pitch_shift", {"semitones": 4}), ("gain", {"gain": 1.5}), ("clip", {}),
+                  ("echo", {"delay_time": 0.4, "decay": 0.5})],
+    "mad_scientist": [("pitch_shift", {"semitones": 5}), ("gain", {"gain": 1.3}), ("clip", {}),
+                      ("echo", {"delay_time": 0.5, "decay": 0.6})],
+    "cybernetic": [("pitch_shift", {"semitones": 3}), ("gain", {"gain": 1.4}), ("clip", {}),
+                   ("modulate", {"frequency": 20})],
+    "galactic": [("pitch_shift", {"semitones": 3}), ("echo", {"delay_time": 0.5, "decay": 0.5}),
+                 ("preemphasis", {}), ("gain", {"gain": 0.8}), ("clip", {})],
+    "celestial": [("chorus", {"depth": 0.5, "rate": 1.3}), ("preemphasis", {}), ("gain", {"gain": 0.6}),
+                  ("clip", {})],
+    "cosmic": [("pitch_shift", {"semitones": 5}), ("echo", {"delay_time": 0.3, "decay": 0.5}),
+               ("preemphasis", {}), ("gain", {"gain": 0.8}), ("clip", {})],
+    "mystical": [("pitch_shift", {"semitones": 3}), ("chorus", {"depth": 0.02, "rate": 1.2}),
+                 ("feedback_delay", {"delay_time": 0.05, "feedback": 0.3})],
+    "enchanted": [("pitch_shift", {"semitones": 4}), ("chorus", {"depth": 0.03, "rate": 1.3}),
+                  ("preemphasis", {}), ("gain", {"gain": 0.7}), ("clip", {})],
+    "transcendent": [("pitch_shift", {"semitones": 6}), ("reverse", {}),
+                     ("feedback_delay", {"delay_time": 0.1, "feedback": 0.5})],
+    "whistle": [("tone", {"frequency": 1500, "level": 0.2})],
+    "synthetic": [("time_stretch", {"rate": 1.3}), ("echo", {"delay_time": 0.2, "decay": 0.5})],
+    "gargling": [("modulate", {"frequency": 40})],
+    "warrior": [("pitch_shift", {"semitones": -3}), ("preemphasis", {}), ("gain", {"gain": 0.5}), ("clip", {})],
+    "wobble": [("vibrato", {"rate": 5.0, "semitones": 0.5})],
+    "vibrato": [("vibrato", {"rate": 5.0, "semitones": 0.5})],
+    "sliced": [("shuffle", {"segment_time": 0.15})],
+    "reversed_slices": [("reverse_segments", {"segment_time": 0.2})],
+    "skipping": [("skip", {"segment_time": 0.08, "keep": 3, "drop": 1})],
+    "glitch_slice": [("glitch_segments", {"segment_time": 0.06})],
+}
+
+
+# Presets whose first stage is a band-limiting filter, so they can run at a reduced sample rate
+REDUCED_RATE_PRESETS = {"telephone", "underwater", "radio", "deep_sea"}
+# Lowest rate a preset is reduced to, so the result still plays back everywhere
+MIN_REDUCED_RATE = 8000
+
+RATE_MODES = ["native", "reduced", "restore"]
+
+# How pitch_shift stages are rendered: librosa's phase vocoder, or the time-domain granular shifter,
+# which runs block by block with one grain of latency
+PITCH_ENGINES = ["phase_vocoder", "granular"]
+
+
+def sound_path(sound):
+    return os.path.join(EFFECTS_SOUNDS_DIR, f"{sound}.wav")
+
+
+# Pointwise stages. Each factory binds its parameters and returns op(block, start, length), which
+# modifies `block` in place; `start` is the index of the block's first sample and `length` the
+# length of the whole signal.
+
+def _gain(sr, gain):
+    def op(block, start, length):
+        block *= gain
+    return op
+
+
+def _clip(sr, limit=1.0):
+    def op(block, start, length):
+        np.clip(block, -limit, limit, out=block)
+    return op
+
+
+def _modulate(sr, frequency, offset=0.0, depth=1.0):
+    # offset + depth * sin(2 pi f t): ring modulation by default, tremolo with a positive offset
+    def op(block, start, length):
+        t = (start + np.arange(block.shape[-1])) / sr
+        block *= offset + depth * np.sin(2 * np.pi * frequency * t)
+    return op
+
+
+def _tone(sr, frequency, level):
+    def op(block, start, length):
+        t = (start + np.arange(block.shape[-1])) / sr
+        block += level * np.sin(2 * np.pi * frequency * t)
+    return op
+
+
+def _noise(sr, level, seed=None):
+    # Unseeded noise is different on every call; with a seed it is a fixed function of sample position
+    def op(block, start, length):
+        if seed is None:
+            block += np.random.normal(0, level, block.shape)
+            return
+        end = start + block.shape[-1]
+        for chunk in range(start // NOISE_CHUNK_SIZE, (end - 1) // NOISE_CHUNK_SIZE + 1):
+            chunk_start = chunk * NOISE_CHUNK_SIZE
+            noise = np.random.default_rng([seed, chunk]).normal(0, level, block.shape[:-1] + (NOISE_CHUNK_SIZE,))
+            begin, stop = max(start, chunk_start), min(end, chunk_start + NOISE_CHUNK_SIZE)
+            block[..., begin - start:stop - start] += noise[..., begin - chunk_start:stop - chunk_start]
+    return op
+
+
+def _fade(sr, duration):
+    # Linear fade in over the first `duration` seconds and fade out over the last
+    fade_length = int(duration * sr)
+
+    def op(block, start, length):
+        end = start + block.shape[-1]
+        if start < fade_length:
+            ramp = np.linspace(0, 1, fade_length)[start:min(end, fade_length)]
+            block[..., :len(ramp)] *= ramp
+        fade_start = length - fade_length
+        if end > fade_start:
+            ramp = np.linspace(1, 0, fade_length)[max(start - fade_start, 0):end - fade_start]
+            block[..., block.shape[-1] - len(ramp):] *= ramp
+    return op
+
+
+def _overlay(sr, sound, effect_start=0, factor=.3):
+    # Pointwise add_bg_effect
+    if effect_start < 0:
+        raise ValueError("thunder_start must be a non-negative value")
+    start_sample = int(effect_start * sr)
+    sound_file = sound_path(sound)
+
+    def op(block, start, length):
+        overlay = load_overlay(sound_file, sr, factor, block.shape[0] if block.ndim > 1 else 1)
+        begin = max(start - start_sample, 0)
+        end = min(start + block.shape[-1] - start_sample, overlay.shape[-1])
+        if end > begin:
+            offset = start_sample + begin - start
+            block[..., offset:offset + end - begin] += overlay[..., begin:end]
+    return op
+
+
+POINTWISE_STAGES = {
+    "gain": _gain,
+    "clip": _clip,
+    "modulate": _modulate,
+    "tone": _tone,
+    "noise": _noise,
+    "fade": _fade,
+    "overlay": _overlay,
+}
+
+
+# Stages that draw random numbers and accept a per-request seed
+SEEDED_STAGES = {"noise", "shuffle", "glitch_segments"}
+
+
+# Whole-signal stages. Each factory binds its parameters (and anything that depends only on the
+# sample rate, such as filter coefficients) and returns fn(audio_data) -> processed audio.
+
+def _filter(sr, name):
+    sos = preset_sos(name, sr)
+    return lambda audio_data: sosfilt(sos, audio_data)
+
+
+def _rearrangement(pieces):
+    # Gather the pieces that pieces(length) selects from the input (see segments.py)
+    return lambda audio_data: rearrange(audio_data, *pieces(audio_data.shape[-1]))
+
+
+def _seeded_rearrangement(arrange, sr, segment_time, seed=None):
+    # The generator is created per call, so a seeded stage rearranges the same way every time
+    segment_length = int(sr * segment_time)
+    return _rearrangement(lambda length: arrange(length, segment_length, np.random.default_rng(seed)))
+
+
+SIGNAL_STAGES = {
+    "pitch_shift": lambda sr, semitones: lambda audio_data: pitch_shift(audio_data, sr, semitones),
+    "granular_pitch_shift": lambda sr, semitones: lambda audio_data: granular_pitch_shift(audio_data, sr,
+                                                                                         semitones),
+    "pitch_and_speed": lambda sr, semitones, rate: lambda audio_data: pitch_and_speed(audio_data, sr, semitones,
+                                                                                       rate),
+    "time_stretch": lambda sr, rate: lambda audio_data: change_speed(audio_data, rate),
+    "harmonic": lambda sr: analysis.harmonic,
+    "filter": _filter,
+    "preemphasis": lambda sr, coef=0.97: lambda audio_data: librosa.effects.preemphasis(audio_data, coef=coef),
+    "echo": lambda sr, delay_time, decay, taps=1: lambda audio_data: feedforward_echo(audio_data, sr, delay_time,
+                                                                                      decay, taps),
+    "feedback_delay": lambda sr, delay_time, feedback: lambda audio_data: feedback_delay(audio_data, sr, delay_time,
+                                                                                         feedback),
+    "chorus": lambda sr, depth, rate, voices=1: lambda audio_data: modulated_delay(audio_data, sr, depth=depth,
+                                                                                   rate=rate, voices=voices),
+    "flanger": lambda sr: lambda audio_data: apply_flanger_voice(audio_data, sr),
+    "vibrato": lambda sr, rate=5.0, semitones=0.5: lambda audio_data: vibrato(audio_data, sr, rate, semitones),
+    "reverse": lambda sr: _rearrangement(segments.reverse),
+    "stutter": lambda sr, stutter_factor=0.1: _rearrangement(
+        lambda length: segments.stutter(length, int(sr * stutter_factor))),
+    "reverse_segments": lambda sr, segment_time: _rearrangement(
+        lambda length: segments.reverse_segments(length, int(sr * segment_time))),
+    "skip": lambda sr, segment_time, keep=3, drop=1: _rearrangement(
+        lambda length: segments.skip(length, int(sr * segment_time), keep, drop)),
+    "shuffle": lambda sr, segment_time, seed=None: _seeded_rearrangement(segments.shuffle, sr, segment_time, seed),
+    "glitch_segments": lambda sr, segment_time, seed=None: _seeded_rearrangement(segments.glitch, sr, segment_time,
+                                                                                 seed),
+}
+
+# Stages that may return a view of their input rather than a new array: a rearrangement that comes
+# down to a single piece (reverse, or any of them on a clip shorter than one segment) is a slice
+VIEW_STAGES = {"reverse", "stutter", "reverse_segments", "skip", "shuffle", "glitch_segments"}
+
+# Stages whose time goes mostly into Python-level loops that hold the GIL (librosa's phase vocoder
+# iterates over STFT frames)
+GIL_BOUND_STAGES = {"pitch_shift", "pitch_and_speed", "time_stretch"}
+
+# Stages that start from the STFT of their input, which analysis.py shares between them
+SPECTRAL_STAGES = {"pitch_shift", "pitch_and_speed", "time_stretch", "harmonic"}
+
+# Peak memory of a whole-signal stage in bytes per input sample, including its output, as measured
+# with tracemalloc on float32 input; other whole-signal stages take DEFAULT_STAGE_MEMORY. Pointwise
+# runs work in place and cost at most one copy of the signal.
+STAGE_MEMORY = {
+    "pitch_shift": 48,
+    "pitch_and_speed": 48,
+    "time_stretch": 45,
+    "harmonic": 80,
+    "granular_pitch_shift": 112,
+    "chorus": 53,
+    "flanger": 53,
+    "vibrato": 53,
+    "stutter": 24,
+    "reverse_segments": 16,
+    "skip": 16,
+    "shuffle": 16,
+    "glitch_segments": 16,
+    "reverse": 0,
+    "feedback_delay": 4,
+}
+DEFAULT_STAGE_MEMORY = 8
+POINTWISE_MEMORY = 4
+
+# Processing time of each stage in nanoseconds per input sample, measured single-threaded on speech;
+# stages not listed take DEFAULT_STAGE_COST. Only the ratios matter to admission control.
+STAGE_COST = {
+    "pitch_shift": 1100,
+    "pitch_and_speed": 280,
+    "time_stretch": 280,
+    "harmonic": 3100,
+    "granular_pitch_shift": 135,
+    "chorus": 65,
+    "flanger": 65,
+    "vibrato": 52,
+    "overlay": 30,
+    "filter": 25,
+    "modulate": 22,
+    "tone": 22,
+    "noise": 20,
+    "stutter": 10,
+    "reverse_segments": 6,
+    "skip": 5,
+    "shuffle": 6,
+    "glitch_segments": 7,
+    "reverse": 0,
+}
+DEFAULT_STAGE_COST = 2
+# Decoding the upload and encoding each output, in the same unit
+IO_COST = 30
+
+
+class FusedPointwise:
+    # A run of adjacent pointwise stages applied together, block by block, in place
+
+    def __init__(self, stages, ops):
+        self.stages = stages
+        self.ops = ops
+
+    def apply(self, audio_data, start=0, length=None, block_size=FUSED_BLOCK_SIZE):
+        length = audio_data.shape[-1] if length is None else length
+        for offset in range(0, audio_data.shape[-1], block_size):
+            block = audio_data[..., offset:offset + block_size]
+            for op in self.ops:
+                op(block, start + offset, length)
+        return audio_data
+
+
+class SignalStage:
+    def __init__(self, stage, params, fn):
+        self.stage = stage
+        self.params = params
+        self.fn = fn
+
+
+class CompiledPreset:
+    # The executable form of a preset chain for one sample rate
+
+    def __init__(self, steps):
+        self.steps = steps
+
+    def __call__(self, audio_data):
+        # Only copy when a pointwise run would otherwise write into the caller's array
+        owned = False
+        with analysis.analysis_scope():
+            for step in self.steps:
+                if isinstance(step, FusedPointwise):
+                    if not owned or not audio_data.flags.writeable or not np.issubdtype(audio_data.dtype,
+                                                                                         np.floating):
+                        audio_data = np.array(audio_data, dtype=np.result_type(audio_data.dtype, np.float32))
+                        owned = True
+                    # Its analysis no longer matches once the array is modified in place
+                    analysis.forget(audio_data)
+                    step.apply(audio_data)
+                else:
+                    audio_data = step.fn(audio_data)
+                    if step.stage not in VIEW_STAGES:
+                        owned = True
+        return audio_data
+
+
+def compile_stages(stages, sr, seed=None):
+    # Bind every stage to the sample rate and merge adjacent pointwise stages into one fused pass
+    steps = []
+    for stage, params in stages:
+        if stage in SEEDED_STAGES and seed is not None:
+            params = dict(params, seed=seed)
+        if stage in POINTWISE_STAGES:
+            op = POINTWISE_STAGES[stage](sr, **params)
+            if steps and isinstance(steps[-1], FusedPointwise):
+                steps[-1].stages.append((stage, params))
+                steps[-1].ops.append(op)
+            else:
+                steps.append(FusedPointwise([(stage, params)], [op]))
+        elif stage in SIGNAL_STAGES:
+            steps.append(SignalStage(stage, params, SIGNAL_STAGES[stage](sr, **params)))
+        else:
+            raise ValueError(f"Unknown stage: {stage}")
+    return CompiledPreset(steps)
+
+
+def with_pitch_engine(stages, pitch_engine="phase_vocoder"):
+    # The granular engine replaces every pitch_shift stage with its time-domain counterpart
+    if pitch_engine == "phase_vocoder":
+        return stages
+    return [("granular_pitch_shift", params) if stage == "pitch_shift" else (stage, params)
+            for stage, params in stages]
+
+
+def preset_stages(name, pitch_engine="phase_vocoder"):
+    return with_pitch_engine(PRESETS[name], pitch_engine)
+
+
+def effective_pitch_engine(name, pitch_engine):
+    # Presets without a pitch_shift stage render the same with either engine
+    return pitch_engine if any(stage == "pitch_shift" for stage, _ in PRESETS[name]) else "phase_vocoder"
+
+
+@lru_cache(maxsize=256)
+def compile_preset(name, sr, seed=None, pitch_engine="phase_vocoder"):
+    return compile_stages(preset_stages(name, pitch_engine), sr, seed)
+
+
+def render_preset(name, audio_data, sr, seed=None, pitch_engine="phase_vocoder"):
+    return compile_preset(name, sr, seed, pitch_engine)(audio_data)
+
+
+def is_gil_bound(name, pitch_engine="phase_vocoder"):
+    return any(stage in GIL_BOUND_STAGES for stage, _ in preset_stages(name, pitch_engine))
+
+
+def stage_memory(stage, params):
+    if stage in POINTWISE_STAGES:
+        return POINTWISE_MEMORY
+    memory = STAGE_MEMORY.get(stage, DEFAULT_STAGE_MEMORY)
+    # The phase vocoder stages grow with the stretched signal they work on
+    if stage == "pitch_shift":
+        return memory * max(1.0, 2.0 ** (params["semitones"] / 12))
+    if stage in SPECTRAL_STAGES and "rate" in params:
+        return memory / min(1.0, params["rate"])
+    return memory
+
+
+def estimate_peak_memory(names, samples, pitch_engine="phase_vocoder"):
+    # Rough peak memory in bytes of rendering `samples` input samples with each of the presets: the
+    # decoded input, plus for every preset its most expensive stage and its rendered and encoded output
+    per_sample = 4 + sum(max(stage_memory(stage, params) for stage, params in preset_stages(name, pitch_engine)) + 8
+                         for name in names)
+    return int(per_sample * samples)
+
+
+def stage_cost(stage, params):
+    cost = STAGE_COST.get(stage, DEFAULT_STAGE_COST)
+    if stage == "pitch_shift":
+        return cost * max(1.0, 2.0 ** (params["semitones"] / 12))
+    if stage in SPECTRAL_STAGES and "rate" in params:
+        return cost / params["rate"]
+    return cost
+
+
+def preset_cost(name, pitch_engine="phase_vocoder"):
+    # Cost coefficient of the preset in nanoseconds per input sample
+    return sum(stage_cost(stage, params) for stage, params in preset_stages(name, pitch_engine))
+
+
+def estimate_cost(names, samples, pitch_engine="phase_vocoder"):
+    # Estimated seconds of processing to render `samples` input samples with each of the presets
+    return samples * (IO_COST + sum(preset_cost(name, pitch_engine) + IO_COST for name in names)) / 1e9
+
+
+def estimate_stages_cost(stages, samples):
+    # The same for a single chain of stages outside the presets
+    return samples * (2 * IO_COST + sum(stage_cost(stage, params) for stage, params in stages)) / 1e9
+
+
+def render_stages(audio_data, stages, sr, seed=None):
+    return compile_stages(stages, sr, seed)(audio_data)
+
+
+def render_branches(audio_data, branches, sr, seed=None):
+    # Render several stage chains of the same input in one analysis scope, so chains that start with
+    # a spectral stage share the input's STFT
+    with analysis.analysis_scope():
+        return [render_stages(audio_data, stages, sr, seed) for stages in branches]
+
+
+class PresetNode:
+    # A run of stages shared by every preset below it in a preset tree; `names` are the presets
+    # whose chain ends here and `children` continue from this node's output
+
+    def __init__(self, stages, names, children):
+        self.stages = stages
+        self.names = names
+        self.children = children
+
+    @property
+    def gil_bound(self):
+        return any(stage in GIL_BOUND_STAGES for stage, _ in self.stages)
+
+    @property
+    def spectral(self):
+        return self.stages[0][0] in SPECTRAL_STAGES
+
+
+def _stage_key(stage):
+    name, params = stage
+    return name, tuple(sorted(params.items()))
+
+
+def _common_prefix(chains):
+    length = 0
+    while all(len(chain) > length for chain in chains) and len({_stage_key(chain[length]) for chain in chains}) == 1:
+        length += 1
+    return chains[0][:length]
+
+
+def _branch(chains):
+    groups = {}
+    for name, stages in chains:
+        groups.setdefault(_stage_key(stages[0]), []).append((name, stages))
+    nodes = []
+    for group in groups.values():
+        prefix = _common_prefix([stages for _, stages in group])
+        names = [name for name, stages in group if len(stages) == len(prefix)]
+        rest = [(name, stages[len(prefix):]) for name, stages in group if len(stages) > len(prefix)]
+        nodes.append(PresetNode(prefix, names, _branch(rest)))
+    return nodes
+
+
+def preset_tree(names, pitch_engine="phase_vocoder"):
+    # Merge the chains of several presets on their common leading stages, so rendering the tree
+    # computes every distinct intermediate result once
+    return _branch([(name, preset_stages(name, pitch_engine)) for name in dict.fromkeys(names)])
+
+
+def passband_edge(name):
+    # Upper edge in Hz of the filter a reduced-rate preset starts with
+    stage, params = PRESETS[name][0]
+    _, cutoff, _ = FILTER_PRESETS[params["name"]]
+    return max(cutoff) if isinstance(cutoff, tuple) else cutoff
+
+
+def reduction_factor(name, sr, rate_mode="native"):
+    if rate_mode == "native" or name not in REDUCED_RATE_PRESETS:
+        return 1
+    return decimation_factor(sr, passband_edge(name), MIN_REDUCED_RATE)
+
+
+def output_rate(name, sr, rate_mode="native"):
+    # Sample rate of the rendered audio: "reduced" returns it at the processing rate, "restore"
+    # upsamples it back to the upload rate
+    return sr if rate_mode == "restore" else sr // reduction_factor(name, sr, rate_mode)
+
+
+def render_reduced(name, audio_data, sr, rate_mode="native", seed=None):
+    # Render a band-limited preset at sr / factor, where everything above its passband is gone anyway
+    factor = reduction_factor(name, sr, rate_mode)
+    if factor == 1:
+        return render_preset(name, audio_data, sr, seed)
+    fir = design_decimator(sr, factor, passband_edge(name))
+    processed = render_preset(name, decimate(audio_data, factor, fir), sr // factor, seed)
+    if rate_mode == "restore":
+        return interpolate(processed, factor, fir, audio_data.shape[-1])
+    return processed
+
+
+def is_deterministic(name, seed=None):
+    # Whether the same input always renders to the same output, which is what makes it cacheable
+    return seed is not None or not any(stage in SEEDED_STAGES for stage, _ in PRESETS[name])
+
+
+# Uniform effect_function(audio_data, sr) entry points for every preset
+effect_functions = {name: functools.partial(render_preset, name) for name in PRESETS}
+
+gil_bound_effects = {name for name in PRESETS if is_gil_bound(name)}
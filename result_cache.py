@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from config import MAX_PROCESSING_SR, RESULT_CACHE_DIR, RESULT_CACHE_DISK_BYTES, RESULT_CACHE_MEMORY_BYTES
+from workers import run_blocking
+
+HASH_CHUNK_SIZE = 1 << 20
+
+_lock = threading.Lock()
+_results = OrderedDict()
+_memory_bytes = 0
+_disk_bytes = None
+_stats = {"hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "disk_evictions": 0}
+# Futures of the renders currently running, so identical requests wait for the first one
+_in_flight = {}
+
+
+def upload_hash(file_obj):
+    digest = hashlib.sha256()
+    file_obj.seek(0)
+    for chunk in iter(lambda: file_obj.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+def result_key(upload_digest, endpoint, name, **params):
+    # Content address of a render: the upload bytes plus everything that changes the output,
+    # including the server's processing rate cap
+    parameters = repr((endpoint, name, MAX_PROCESSING_SR, sorted(params.items()))).encode()
+    return hashlib.sha256(upload_digest.encode() + parameters).hexdigest()
+
+
+def _remember(key, data):
+    # Memory tier: least recently used results go first once the byte budget is exceeded
+    global _memory_bytes
+    if len(data) > RESULT_CACHE_MEMORY_BYTES:
+        return
+    with _lock:
+        if key in _results:
+            _results.move_to_end(key)
+            return
+        _results[key] = data
+        _memory_bytes += len(data)
+        while _memory_bytes > RESULT_CACHE_MEMORY_BYTES:
+            _, evicted = _results.popitem(last=False)
+            _memory_bytes -= len(evicted)
+            _stats["evictions"] += 1
+
+
+def _disk_path(key):
+    return os.path.join(RESULT_CACHE_DIR, key[:2], key)
+
+
+def _disk_entries():
+    for root, _, files in os.walk(RESULT_CACHE_DIR):
+        for file in files:
+            if not file.startswith("."):
+                yield os.path.join(root, file)
+
+
+def _disk_usage():
+    # Scanned once, then kept up to date as results are written and evicted
+    global _disk_bytes
+    if _disk_bytes is None:
+        _disk_bytes = sum(os.path.getsize(path) for path in _disk_entries())
+    return _disk_bytes
+
+
+def _read_disk(key):
+    if not RESULT_CACHE_DIR:
+        return None
+    path = _disk_path(key)
+    try:
+        with open(path, "rb") as result_file:
+            data = result_file.read()
+        # The modification time doubles as the last access time for eviction
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return data
+
+
+def _write_disk(key, data):
+    # Disk tier: written through a temp file so readers never see a partial result, then the least
+    # recently used files are removed until the directory is back under its size limit
+    global _disk_bytes
+    if not RESULT_CACHE_DIR or len(data) > RESULT_CACHE_DISK_BYTES:
+        return
+    path = _disk_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix=".", delete=False) as temp_file:
+        temp_file.write(data)
+    with _lock:
+        usage = _disk_usage()
+        existed = os.path.exists(path)
+        os.replace(temp_file.name, path)
+        if existed:
+            return
+        _disk_bytes = usage + len(data)
+        if _disk_bytes <= RESULT_CACHE_DISK_BYTES:
+            return
+        entries = []
+        for entry in _disk_entries():
+            try:
+                entries.append((os.path.getmtime(entry), entry))
+            except FileNotFoundError:
+                pass
+        for _, entry in sorted(entries):
+            if _disk_bytes <= RESULT_CACHE_DISK_BYTES:
+                break
+            try:
+                size = os.path.getsize(entry)
+                os.remove(entry)
+            except FileNotFoundError:
+                continue
+            _disk_bytes -= size
+            _stats["disk_evictions"] += 1
+
+
+def lookup(key):
+    # Return (data, tier) for a cached result, or (None, None)
+    with _lock:
+        data = _results.get(key)
+        if data is not None:
+            _results.move_to_end(key)
+            _stats["hits"] += 1
+            return data, "memory"
+    data = _read_disk(key)
+    if data is not None:
+        with _lock:
+            _stats["disk_hits"] += 1
+        _remember(key, data)
+        return data, "disk"
+    with _lock:
+        _stats["misses"] += 1
+    return None, None
+
+
+def store(key, data):
+    _remember(key, data)
+    _write_disk(key, data)
+
+
+async def cached_result(key, render):
+    # Return (data, source) where source is "memory", "disk", "coalesced" or "miss". `render` is a
+    # coroutine function producing the encoded bytes; it runs at most once per key at a time.
+    while True:
+        pending = _in_flight.get(key)
+        if pending is None:
+            data, tier = await run_blocking(lookup, key)
+            if data is not None:
+                return data, tier
+            pending = _in_flight.get(key)
+        if pending is None:
+            break
+        with _lock:
+            _stats["coalesced"] += 1
+        try:
+            return await asyncio.shield(pending), "coalesced"
+        except asyncio.CancelledError:
+            # The request rendering it went away; still connected waiters take over rather than fail
+            if not pending.cancelled():
+                raise
+    future = _in_flight[key] = asyncio.get_running_loop().create_future()
+    # Waiters re-raise a failed render themselves; this only keeps an unobserved failure from being logged
+    future.add_done_callback(lambda done: done.cancelled() or done.exception())
+    try:
+        data = await render()
+        await run_blocking(store, key, data)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(data)
+    finally:
+        del _in_flight[key]
+    return data, "miss"
+
+
+def store_stream(key, chunks):
+    # Pass a streamed response through and cache it once it has been sent completely
+    sent = []
+    for chunk in chunks:
+        sent.append(chunk)
+        yield chunk
+    store(key, b"".join(sent))
+
+
+def result_cache_stats():
+    with _lock:
+        lookups = _stats["hits"] + _stats["disk_hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "entries": len(_results),
+            "bytes": _memory_bytes,
+            "disk_bytes": _disk_bytes or 0,
+            "hit_rate": (_stats["hits"] + _stats["disk_hits"]) / lookups if lookups else 0.0,
+        }
+
+
+def clear_result_cache():
+    global _memory_bytes
+    with _lock:
+        _results.clear()
+        _memory_bytes = 0
+        for counter in _stats:
+            _stats[counter] = 0
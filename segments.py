@@ -0,0 +1,78 @@
+import numpy as np
+
+# A rearrangement of a signal is a list of pieces of it: (starts, lengths, backwards) arrays giving
+# where each piece starts in the input, how long it is and whether it is played in reverse. The
+# pieces are turned into one integer index map and gathered in a single vectorized step.
+
+# Choices of the glitch rearrangement, in the order of GLITCH_PROBABILITIES
+PLAY, REPEAT, REVERSE, SKIP = range(4)
+GLITCH_PROBABILITIES = (0.55, 0.2, 0.15, 0.1)
+
+
+def segment_bounds(length, segment_length):
+    # (starts, lengths) of consecutive segments covering the signal; the last one may be shorter
+    segment_length = max(int(segment_length), 1)
+    starts = np.arange(0, length, segment_length, dtype=np.int64)
+    return starts, np.minimum(segment_length, length - starts)
+
+
+def index_map(starts, lengths, backwards=None):
+    # Output sample i of a piece starting at output position p reads start + (i - p), or
+    # start + length - 1 - (i - p) when the piece is backwards
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    positions = np.cumsum(lengths) - lengths
+    if backwards is None:
+        backwards = np.zeros(len(starts), dtype=bool)
+    step = np.where(backwards, -1, 1)
+    base = np.where(backwards, starts + lengths - 1 + positions, starts - positions)
+    output = np.arange(int(lengths.sum()), dtype=np.int64)
+    output *= np.repeat(step, lengths)
+    output += np.repeat(base, lengths)
+    return output
+
+
+def rearrange(audio_data, starts, lengths, backwards=None):
+    # Gather the pieces along the last axis; a single piece is returned as a view of the input
+    if len(starts) == 1:
+        piece = audio_data[..., starts[0]:starts[0] + lengths[0]]
+        return piece[..., ::-1] if backwards is not None and backwards[0] else piece
+    return audio_data[..., index_map(starts, lengths, backwards)]
+
+
+def stutter(length, segment_length, repeat_fraction=0.5):
+    # Every segment followed by a repeat of its first part
+    starts, lengths = segment_bounds(length, segment_length)
+    repeats = np.minimum(int(max(int(segment_length), 1) * repeat_fraction), lengths)
+    return np.repeat(starts, 2), np.column_stack([lengths, repeats]).ravel(), None
+
+
+def reverse(length):
+    return np.zeros(1, dtype=np.int64), np.array([length]), np.ones(1, dtype=bool)
+
+
+def reverse_segments(length, segment_length):
+    # Segments in their original order, each played backwards
+    starts, lengths = segment_bounds(length, segment_length)
+    return starts, lengths, np.ones(len(starts), dtype=bool)
+
+
+def skip(length, segment_length, keep=3, drop=1):
+    # Play `keep` segments, leave out the next `drop`, and so on
+    starts, lengths = segment_bounds(length, segment_length)
+    kept = np.arange(len(starts)) % (keep + drop) < keep
+    return starts[kept], lengths[kept], None
+
+
+def shuffle(length, segment_length, rng):
+    starts, lengths = segment_bounds(length, segment_length)
+    order = rng.permutation(len(starts))
+    return starts[order], lengths[order], None
+
+
+def glitch(length, segment_length, rng, probabilities=GLITCH_PROBABILITIES):
+    # Each segment is independently played, repeated, reversed or skipped
+    starts, lengths = segment_bounds(length, segment_length)
+    choices = rng.choice(len(probabilities), size=len(starts), p=probabilities)
+    counts = np.where(choices == REPEAT, 2, np.where(choices == SKIP, 0, 1))
+    return np.repeat(starts, counts), np.repeat(lengths, counts), np.repeat(choices == REVERSE, counts)
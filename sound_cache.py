@@ -0,0 +1,91 @@
+import os
+import threading
+from collections import OrderedDict
+
+import librosa
+import soundfile as sf
+
+from config import EFFECTS_SOUNDS_DIR, OVERLAY_CACHE_SIZE, OVERLAY_PREWARM_GAIN, OVERLAY_PREWARM_RATES
+
+_lock = threading.Lock()
+_overlays = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "decodes": 0, "evictions": 0}
+
+
+def sound_name(sound_file):
+    # "effects_sounds/radio.wav" -> "radio"
+    return os.path.splitext(os.path.basename(sound_file))[0]
+
+
+def available_sounds(directory=EFFECTS_SOUNDS_DIR):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(sound_name(file) for file in os.listdir(directory) if file.endswith(".wav"))
+
+
+def _store(key, overlay):
+    overlay.flags.writeable = False
+    with _lock:
+        _overlays[key] = overlay
+        _overlays.move_to_end(key)
+        while len(_overlays) > OVERLAY_CACHE_SIZE:
+            _overlays.popitem(last=False)
+            _stats["evictions"] += 1
+    return overlay
+
+
+def load_overlay(sound_file, sr, gain=1.0, channels=1):
+    # Return the background sound decoded at `sr` and scaled by `gain`; the array is shared, so it is read-only.
+    # For multi-channel audio it is (channels, samples) when the sound has that many channels, otherwise
+    # the mono mix, which broadcasts over every channel.
+    name = sound_name(sound_file)
+    key = (name, sr, gain, channels)
+    with _lock:
+        overlay = _overlays.get(key)
+        if overlay is not None:
+            _overlays.move_to_end(key)
+            _stats["hits"] += 1
+            return overlay
+        _stats["misses"] += 1
+        # Another gain of the same sound at this rate only needs rescaling, not a second decode
+        same_rate = next(((other_gain, value) for (other, other_sr, other_gain, other_channels), value
+                          in _overlays.items()
+                          if other == name and other_sr == sr and other_channels == channels and other_gain),
+                         None)
+    if same_rate is not None:
+        other_gain, overlay = same_rate
+        return _store(key, overlay * (gain / other_gain))
+    if channels > 1 and sf.info(sound_file).channels != channels:
+        # Share the mono entry rather than decoding the sound again
+        return _store(key, load_overlay(sound_file, sr, gain))
+    overlay, _ = librosa.load(sound_file, sr=sr, mono=channels == 1)
+    with _lock:
+        _stats["decodes"] += 1
+    return _store(key, overlay * gain)
+
+
+def prewarm(rates=OVERLAY_PREWARM_RATES, gain=OVERLAY_PREWARM_GAIN, directory=EFFECTS_SOUNDS_DIR):
+    # Decode every background sound at the common upload rates ahead of the first request
+    for name in available_sounds(directory):
+        for sr in rates:
+            load_overlay(os.path.join(directory, f"{name}.wav"), sr, gain)
+
+
+def overlay_cache_stats():
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        # Multi-channel entries of a mono sound share the mono array
+        unique = {id(overlay): overlay for overlay in _overlays.values()}
+        return {
+            **_stats,
+            "entries": len(_overlays),
+            "bytes": sum(overlay.nbytes for overlay in unique.values()),
+            "hit_rate": _stats["hits"] / lookups if lookups else 0.0,
+        }
+
+
+def clear_overlay_cache():
+    with _lock:
+        _overlays.clear()
+        for counter in _stats:
+            _stats[counter] = 0
@@ -0,0 +1,291 @@
+import io
+import struct
+from abc import ABC, abstractmethod
+
+import numpy as np
+import soundfile as sf
+from scipy.signal import lfilter
+
+from audio_io import decode_audio_file, to_mono, window_frames
+from config import MAX_PROCESSING_SR, STREAM_BLOCK_SIZE
+from delay_line import delay_samples_for
+from filters import SosFilter
+from granular import GrainShifter
+from modulated_delay import fractional_delay, vibrato_depth
+from presets import POINTWISE_STAGES, FusedPointwise, compile_stages, preset_stages
+
+
+class BlockProcessor(ABC):
+    # A causal, length-preserving processing step. Whatever has to carry over from one block to the
+    # next (filter state, delay lines, LFO phase) lives on the instance; `position` is the index of
+    # the first sample of the block being processed.
+
+    def __init__(self):
+        self.position = 0
+
+    def process(self, block):
+        processed = self.process_block(block)
+        self.position += block.shape[-1]
+        return processed
+
+    @abstractmethod
+    def process_block(self, block):
+        # The processed block, the same length as `block`
+        pass
+
+
+class Filter(BlockProcessor):
+    def __init__(self, name, sr):
+        super().__init__()
+        self.filter = SosFilter.from_preset(name, sr)
+
+    def process_block(self, block):
+        return self.filter.process(block)
+
+
+class Preemphasis(BlockProcessor):
+    # Block-wise librosa.effects.preemphasis with the filter state carried over
+    def __init__(self, coef=0.97):
+        super().__init__()
+        self.coef = coef
+        self.zi = None
+
+    def process_block(self, block):
+        b = np.asarray([1.0, -self.coef], dtype=block.dtype)
+        if self.zi is None:
+            # Same linear-extrapolation start as librosa.effects.preemphasis
+            self.zi = 2 * block[..., 0:1] - block[..., 1:2] if block.shape[-1] > 1 else block[..., 0:1]
+        emphasized, self.zi = lfilter(b, [1.0], block, zi=np.asarray(self.zi, dtype=block.dtype))
+        return emphasized
+
+
+class Echo(BlockProcessor):
+    # Block-wise feedforward_echo; keeps the last `taps * delay` input samples
+    def __init__(self, sr, delay_time=0.5, decay=0.5, taps=1):
+        super().__init__()
+        self.delay_samples = delay_samples_for(sr, delay_time)
+        self.decay = decay
+        self.taps = taps
+        self.history = None
+
+    def process_block(self, block):
+        span = self.taps * self.delay_samples
+        if self.history is None:
+            self.history = np.zeros(block.shape[:-1] + (span,), dtype=block.dtype)
+        buffer = np.concatenate([self.history, block], axis=-1)
+        length = block.shape[-1]
+        echo_audio = np.array(block)
+        gain = 1.0
+        for tap in range(1, self.taps + 1):
+            gain *= self.decay
+            start = span - tap * self.delay_samples
+            echo_audio += gain * buffer[..., start:start + length]
+        self.history = buffer[..., buffer.shape[-1] - span:]
+        return echo_audio
+
+
+class FeedbackDelay(BlockProcessor):
+    # Block-wise feedback_delay; keeps the last `delay` output samples
+    def __init__(self, sr, delay_time=0.1, feedback=0.4):
+        super().__init__()
+        self.delay_samples = delay_samples_for(sr, delay_time)
+        self.feedback = feedback
+        self.history = None
+
+    def process_block(self, block):
+        delay = self.delay_samples
+        if delay <= 0:
+            return np.array(block)
+        if self.history is None:
+            self.history = np.zeros(block.shape[:-1] + (delay,), dtype=block.dtype)
+        length = block.shape[-1]
+        dry = np.array(block)
+        # The first delay period is silent, as in the whole-file version
+        silent = max(0, min(delay - self.position, length))
+        dry[..., :silent] = 0
+        buffer = np.concatenate([self.history, np.zeros_like(dry)], axis=-1)
+        for start in range(0, length, delay):
+            end = min(start + delay, length)
+            buffer[..., delay + start:delay + end] = dry[..., start:end] + self.feedback * buffer[..., start:end]
+        self.history = buffer[..., buffer.shape[-1] - delay:]
+        return buffer[..., delay:]
+
+
+class Flanger(BlockProcessor):
+    # Block-wise apply_flanger_voice: 3 ms sweep at 0.25 Hz, mixed in at half level
+    def __init__(self, sr, max_delay_time=0.003, rate=0.25, mix=0.5):
+        super().__init__()
+        self.sr = sr
+        self.max_delay = int(max_delay_time * sr)
+        self.rate = rate
+        self.mix = mix
+        self.history = None
+
+    def process_block(self, block):
+        span = self.max_delay + 1
+        if self.history is None:
+            self.history = np.zeros(block.shape[:-1] + (span,), dtype=block.dtype)
+        buffer = np.concatenate([self.history, block], axis=-1)
+        t = (self.position - span + np.arange(buffer.shape[-1])) / self.sr
+        modulation = 0.5 * (1 + np.sin(2 * np.pi * self.rate * t))
+        flanged = fractional_delay(buffer, modulation * self.max_delay)[..., span:]
+        flanged[..., :max(0, self.max_delay - self.position)] = 0
+        self.history = buffer[..., buffer.shape[-1] - span:]
+        return block + self.mix * flanged
+
+
+class Vibrato(BlockProcessor):
+    # Block-wise vibrato: the delay line only has to reach back twice the modulation depth
+    def __init__(self, sr, rate=5.0, semitones=0.5):
+        super().__init__()
+        self.sr = sr
+        self.rate = rate
+        self.depth = vibrato_depth(rate, semitones)
+        self.history = None
+
+    def process_block(self, block):
+        span = int(np.ceil(2 * self.depth * self.sr)) + 1
+        if self.history is None:
+            self.history = np.zeros(block.shape[:-1] + (span,), dtype=block.dtype)
+        buffer = np.concatenate([self.history, block], axis=-1)
+        t = (self.position - span + np.arange(buffer.shape[-1])) / self.sr
+        delay = self.sr * (self.depth + self.depth * np.sin(2 * np.pi * self.rate * t + np.pi / 2))
+        shifted = fractional_delay(buffer, delay)[..., span:]
+        self.history = buffer[..., buffer.shape[-1] - span:]
+        return shifted
+
+
+class Pointwise(BlockProcessor):
+    # A fused run of pointwise preset stages (gain, clip, modulation, noise, overlay, fades)
+    def __init__(self, fused, length):
+        super().__init__()
+        self.fused = fused
+        self.length = length
+
+    def process_block(self, block):
+        processed = np.array(block, dtype=np.result_type(block.dtype, np.float32))
+        return self.fused.apply(processed, start=self.position, length=self.length)
+
+
+# Block processors for the whole-signal stages that can run causally. Presets using any other
+# stage (phase vocoder pitch shift and time stretch, harmonic separation, reversal, the look-ahead
+# chorus, stuttering) need the whole file and are rendered in one pass before being streamed out.
+BLOCK_STAGES = {
+    "filter": lambda sr, name: Filter(name, sr),
+    "preemphasis": lambda sr, coef=0.97: Preemphasis(coef),
+    "echo": lambda sr, **params: Echo(sr, **params),
+    "feedback_delay": lambda sr, **params: FeedbackDelay(sr, **params),
+    "flanger": lambda sr: Flanger(sr),
+    "vibrato": lambda sr, **params: Vibrato(sr, **params),
+    "granular_pitch_shift": lambda sr, semitones: GrainShifter(sr, semitones),
+}
+
+
+def stages_stream(stages):
+    return all(stage in POINTWISE_STAGES or stage in BLOCK_STAGES for stage, _ in stages)
+
+
+def block_chain(stages, sr, length, seed=None):
+    # Build the block processors for a stage chain; adjacent pointwise stages share one processor
+    processors = []
+    for step in compile_stages(stages, sr, seed).steps:
+        if isinstance(step, FusedPointwise):
+            processors.append(Pointwise(step, length))
+        else:
+            processors.append(BLOCK_STAGES[step.stage](sr, **step.params))
+    return processors
+
+
+def streaming_chain(category_name, sr, length, seed=None, pitch_engine="phase_vocoder"):
+    return block_chain(preset_stages(category_name, pitch_engine), sr, length, seed)
+
+
+def needs_whole_file(category_name, pitch_engine="phase_vocoder"):
+    return not stages_stream(preset_stages(category_name, pitch_engine))
+
+
+def background_effect_chain(sr, length, effect_name, start_effect, factor):
+    # Block-wise apply_effect for /voice_effect
+    stages = [("gain", {"gain": .8}),
+              ("overlay", {"sound": effect_name, "effect_start": start_effect, "factor": factor})]
+    return block_chain(stages, sr, length)
+
+
+def open_blocks(file_obj, filename=None, blocksize=STREAM_BLOCK_SIZE, offset=0.0, duration=None,
+                max_sr=MAX_PROCESSING_SR, keep_channels=False):
+    # Return (sr, frames, channels, blocks) for an upload, decoding lazily block by block when libsndfile
+    # can read it. Blocks are mono unless keep_channels is set, then (channels, samples).
+    file_obj.seek(0)
+    try:
+        sound_file = sf.SoundFile(file_obj)
+    except sf.LibsndfileError:
+        sound_file = None
+    if sound_file is None or (max_sr and sound_file.samplerate > max_sr):
+        # Rate-capped uploads are resampled in one pass before being split into blocks
+        if sound_file is not None:
+            sound_file.close()
+        audio_data, sr = decode_audio_file(file_obj, filename, offset, duration, max_sr, keep_channels)
+        channels = audio_data.shape[0] if audio_data.ndim > 1 else 1
+        return sr, audio_data.shape[-1], channels, array_blocks(audio_data, blocksize)
+    start, stop = window_frames(sound_file.samplerate, sound_file.frames, offset, duration)
+    sound_file.seek(start)
+    channels = sound_file.channels if keep_channels else 1
+
+    def blocks():
+        with sound_file:
+            for block in sound_file.blocks(blocksize, frames=stop - start, dtype='float32', always_2d=True):
+                yield to_mono(block) if channels == 1 else np.ascontiguousarray(block.T)
+
+    return sound_file.samplerate, stop - start, channels, blocks()
+
+
+def array_blocks(audio_data, blocksize=STREAM_BLOCK_SIZE):
+    for start in range(0, audio_data.shape[-1], blocksize):
+        yield audio_data[..., start:start + blocksize]
+
+
+def process_blocks(blocks, processors):
+    for block in blocks:
+        for processor in processors:
+            block = processor.process(block)
+        yield block
+
+
+# Sample subtypes a streamed WAV can carry: (WAVE format tag, bits per sample)
+WAV_SUBTYPES = {"PCM_16": (1, 16), "FLOAT": (3, 32)}
+
+
+def wav_header(frames, sr, channels=1, subtype="PCM_16"):
+    # Canonical 44-byte WAV header; the sizes are known up front because streamed presets keep the length
+    format_tag, bits_per_sample = WAV_SUBTYPES[subtype]
+    block_align = channels * bits_per_sample // 8
+    data_size = frames * block_align
+    return (b"RIFF" + struct.pack("<I", 36 + data_size) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, format_tag, channels, sr, sr * block_align, block_align,
+                                    bits_per_sample)
+            + b"data" + struct.pack("<I", data_size))
+
+
+def encode_raw(block, subtype="PCM_16"):
+    # Headerless samples, converted by libsndfile exactly as sf.write(..., format='wav') would
+    output_bytes = io.BytesIO()
+    sf.write(output_bytes, np.asarray(block).T, 1, format='RAW', subtype=subtype)
+    return output_bytes.getvalue()
+
+
+def encode_pcm16(block):
+    return encode_raw(block, "PCM_16")
+
+
+def stream_wav(blocks, sr, frames, channels=1, subtype="PCM_16"):
+    # Yield a WAV file piece by piece: the header first, then each block as soon as it is processed.
+    # The output is trimmed or padded with silence to exactly `frames` so it matches the header.
+    yield wav_header(frames, sr, channels, subtype)
+    written = 0
+    for block in blocks:
+        block = block[..., :frames - written]
+        if block.shape[-1]:
+            written += block.shape[-1]
+            yield encode_raw(block, subtype)
+    if written < frames:
+        yield encode_raw(np.zeros((channels, frames - written) if channels > 1 else frames - written), subtype)
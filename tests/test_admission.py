@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, Overloaded
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_admits_within_budget_and_queues_the_rest():
+    async def scenario():
+        controller = AdmissionController(budget=2.0, memory_budget=0, max_queue=4, workers=1)
+        await controller.acquire(1.5)
+        waiter = asyncio.create_task(controller.acquire(1.0))
+        await asyncio.sleep(0)
+        assert not waiter.done() and len(controller.waiting) == 1
+        controller.release(1.5)
+        await waiter
+        assert (controller.running, controller.work, len(controller.waiting)) == (1, 1.0, 0)
+        controller.release(1.0)
+        assert (controller.running, controller.work, controller.memory) == (0, 0.0, 0)
+    run(scenario())
+
+
+def test_always_admits_when_nothing_runs():
+    async def scenario():
+        controller = AdmissionController(budget=1.0, memory_budget=10, max_queue=4, workers=1)
+        await controller.acquire(50.0, memory=100)
+        assert controller.running == 1
+        controller.release(50.0, memory=100)
+    run(scenario())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        controller = AdmissionController(budget=1.0, memory_budget=0, max_queue=4, workers=1)
+        await controller.acquire(1.0)
+        waiter = asyncio.create_task(controller.acquire(1.0))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert not controller.waiting
+        controller.release(1.0)
+        assert (controller.running, controller.work) == (0, 0.0)
+    run(scenario())
+
+
+def test_waiter_cancelled_just_after_admission_releases_its_slot():
+    async def scenario():
+        controller = AdmissionController(budget=1.0, memory_budget=0, max_queue=4, workers=1)
+        await controller.acquire(1.0)
+        waiter = asyncio.create_task(controller.acquire(1.0, memory=5))
+        await asyncio.sleep(0)
+        # Admitted by the release, but cancelled before it gets to run
+        controller.release(1.0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert (controller.running, controller.work, controller.memory, len(controller.waiting)) == (0, 0.0, 0, 0)
+    run(scenario())
+
+
+def test_full_queue_is_refused_unless_unbounded():
+    async def scenario():
+        controller = AdmissionController(budget=1.0, memory_budget=0, max_queue=1, workers=1)
+        await controller.acquire(1.0)
+        waiter = asyncio.create_task(controller.acquire(1.0))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as refused:
+            await controller.acquire(1.0)
+        assert refused.value.retry_after >= 1
+        job = asyncio.create_task(controller.acquire(1.0, bounded=False))
+        await asyncio.sleep(0)
+        assert len(controller.waiting) == 2
+        for task in (waiter, job):
+            controller.release(1.0)
+            await task
+        controller.release(1.0)
+        assert (controller.running, controller.work) == (0, 0.0)
+    run(scenario())
+
+
+def test_small_request_does_not_overtake_a_queued_large_one():
+    async def scenario():
+        controller = AdmissionController(budget=2.0, memory_budget=0, max_queue=4, workers=1)
+        await controller.acquire(1.5)
+        large = asyncio.create_task(controller.acquire(1.0))
+        await asyncio.sleep(0)
+        # The small request would fit next to the running one, but the large one came first
+        small = asyncio.create_task(controller.acquire(0.5))
+        await asyncio.sleep(0)
+        assert not large.done() and not small.done() and len(controller.waiting) == 2
+        controller.release(1.5)
+        await large
+        await small
+        assert (controller.running, controller.work) == (2, 1.5)
+        controller.release(1.0)
+        controller.release(0.5)
+        assert (controller.running, controller.work) == (0, 0.0)
+    run(scenario())
@@ -0,0 +1,99 @@
+import asyncio
+import io
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+import pytest
+import soundfile as sf
+
+import main
+import result_cache
+from admission import AdmissionController
+from metrics import IN_FLIGHT, RequestTiming
+from result_cache import cached_result
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "admission", AdmissionController(budget=10.0, memory_budget=0, max_queue=8, workers=1))
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_DIR", str(tmp_path))
+    result_cache.clear_result_cache()
+    yield
+    result_cache.clear_result_cache()
+
+
+def in_flight(endpoint):
+    return IN_FLIGHT._values.get(IN_FLIGHT._key({"endpoint": endpoint}), 0)
+
+
+def test_requests_joining_a_render_hold_no_admission_slot():
+    peak = []
+
+    async def render():
+        peak.append(main.admission.running)
+        await asyncio.sleep(0.05)
+        peak.append(main.admission.running)
+        return b"audio"
+
+    async def scenario():
+        requests = [SimpleNamespace(state=SimpleNamespace()) for _ in range(4)]
+        renders = [main.admitted_render(request, RequestTiming("/voice_changer"), 1.0, render)
+                   for request in requests]
+        results = await asyncio.gather(*(cached_result("joined", run) for run in renders))
+        admitted = [request for request in requests if getattr(request.state, "admitted", None) is not None]
+        assert len(admitted) == 1
+        for request in requests:
+            main.release_admission(request)
+        return results
+
+    results = asyncio.run(scenario())
+    assert max(peak) == 1
+    assert sorted(source for _, source in results) == ["coalesced"] * 3 + ["miss"]
+    assert main.admission.running == 0
+
+
+def test_client_disconnect_releases_admission_and_in_flight():
+    upload = io.BytesIO()
+    sf.write(upload, np.zeros(22050, dtype=np.float32), 22050, format="WAV")
+    request = httpx.Request("POST", "http://test/voice_changer", files={"audio_file": ("a.wav", upload.getvalue())},
+                            data={"category_name": "echo", "seed": "5"})
+    body = request.read()
+    scope = {"type": "http", "method": "POST", "path": "/voice_changer", "raw_path": b"/voice_changer",
+             "query_string": b"", "headers": [(k.lower().encode(), v.encode()) for k, v in request.headers.items()],
+             "http_version": "1.1", "scheme": "http", "server": ("test", 80), "client": ("client", 1),
+             "root_path": "", "app": main.app}
+
+    async def disconnecting():
+        received = False
+
+        async def receive():
+            nonlocal received
+            if not received:
+                received = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await asyncio.sleep(10)
+
+        async def send(message):
+            # The client is gone by the time the response starts
+            if message["type"] == "http.response.start":
+                raise OSError("client went away")
+
+        with pytest.raises(OSError):
+            await main.app(scope, receive, send)
+
+    acquired = []
+    acquire = main.admission.acquire
+
+    async def counting_acquire(*args, **kwargs):
+        acquired.append(args)
+        await acquire(*args, **kwargs)
+
+    main.admission.acquire = counting_acquire
+    for _ in range(2):
+        asyncio.run(disconnecting())
+    # The first request rendered, the second one was served from the cache
+    assert len(acquired) == 1
+    assert main.admission.running == 0
+    assert main.admission.work == 0.0
+    assert in_flight("/voice_changer") == 0
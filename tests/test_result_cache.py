@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+import result_cache
+from result_cache import cached_result
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_DIR", str(tmp_path))
+    result_cache.clear_result_cache()
+    yield
+    result_cache.clear_result_cache()
+
+
+def test_identical_requests_share_one_render():
+    calls = []
+
+    async def render():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return b"audio"
+
+    async def scenario():
+        return await asyncio.gather(*(cached_result("shared", render) for _ in range(3)))
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert sorted(source for _, source in results) == ["coalesced", "coalesced", "miss"]
+    assert all(data == b"audio" for data, _ in results)
+
+
+def test_waiter_takes_over_when_the_leader_is_cancelled():
+    calls = []
+
+    async def render():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return b"audio"
+
+    async def scenario():
+        leader = asyncio.create_task(cached_result("takeover", render))
+        await asyncio.sleep(0.01)
+        waiters = [asyncio.create_task(cached_result("takeover", render)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*waiters)
+
+    results = asyncio.run(scenario())
+    # One waiter renders again, the other joins it
+    assert len(calls) == 2
+    assert sorted(source for _, source in results) == ["coalesced", "miss"]
+    assert all(data == b"audio" for data, _ in results)
+    assert not result_cache._in_flight
+
+
+def test_cancelled_waiter_does_not_cancel_the_render():
+    async def render():
+        await asyncio.sleep(0.05)
+        return b"audio"
+
+    async def scenario():
+        leader = asyncio.create_task(cached_result("waiter", render))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(cached_result("waiter", render))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return await leader
+
+    assert asyncio.run(scenario()) == (b"audio", "miss")
+
+
+def test_failed_render_reaches_the_waiters():
+    async def render():
+        await asyncio.sleep(0.05)
+        raise ValueError("bad input")
+
+    async def scenario():
+        return await asyncio.gather(*(cached_result("failed", render) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert not result_cache._in_flight
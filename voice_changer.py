@@ -1,65 +1,41 @@
 import numpy as np
 import librosa
-import soundfile as sf
-from scipy.signal import butter, sosfilt
+from scipy.signal import sosfilt
 import librosa.effects
 
+import analysis
+from delay_line import feedforward_echo, feedback_delay
+from effects import apply_flanger_voice, change_speed, pitch_and_speed, pitch_shift, save_audio
+from filters import preset_sos
+from modulated_delay import modulated_delay, vibrato
+from segments import rearrange, stutter
+
 
 def apply_delay(audio_data, sr, delay_time=0.1, feedback=0.4):
-    delay_samples = int(sr * delay_time)
-    delayed_audio = np.zeros_like(audio_data)
-    for i in range(delay_samples, len(audio_data)):
-        delayed_audio[i] = audio_data[i] + feedback * delayed_audio[i - delay_samples]
-    return delayed_audio
+    # Apply a feedback delay (comb filter)
+    return feedback_delay(audio_data, sr, delay_time=delay_time, feedback=feedback)
 
 
-def apply_chorus(audio_data, sr, depth=0.03, delay=0.004, rate=1.3):
-    modulator = np.sin(2 * np.pi * rate * np.arange(len(audio_data)) / sr)
-    modulator *= depth * sr
-    chorus_audio = np.copy(audio_data)
-    for i in range(len(audio_data)):
-        delay_index = int(i - modulator[i])
-        if 0 <= delay_index < len(audio_data):
-            chorus_audio[i] += audio_data[delay_index]
-    return chorus_audio
+def apply_chorus(audio_data, sr, depth=0.03, delay=0.004, rate=1.3, voices=1):
+    # Apply a chorus by mixing in copies read through a sine-modulated delay line
+    return modulated_delay(audio_data, sr, depth=depth, rate=rate, voices=voices)
 
 
-def load_audio(file_path):
+def load_audio(file_path, keep_channels=False):
     # Load the audio file using librosa
-    audio_data, sr = librosa.load(file_path, sr=None)
+    audio_data, sr = librosa.load(file_path, sr=None, mono=not keep_channels)
     return audio_data, sr
 
 
-def save_audio(audio_data, file_path, sr):
-    # Save the modified audio to a file
-    sf.write(file_path, audio_data, sr)
-
-
-def pitch_shift(audio_data, sr, semitone_shift):
-    # Perform pitch shifting
-    shifted_audio = librosa.effects.pitch_shift(audio_data, sr=sr, n_steps=semitone_shift)
-    return shifted_audio
-
-
 def increase_volume(audio_data, volume_factor):
     # Increase the volume of the audio
     audio_data *= volume_factor
     return audio_data
 
 
-def change_speed(audio_data, rate):
-    # Change the speed of the audio
-    sped_audio = librosa.effects.time_stretch(audio_data, rate=rate)
-    return sped_audio
-
-
-def apply_echo(audio_data, sr, delay_factor=0.5, decay=0.5):
+def apply_echo(audio_data, sr, delay_factor=0.5, decay=0.5, taps=1):
     # Apply echo effect using repetition with decay
-    echo_audio = np.copy(audio_data)
-    delay_samples = int(sr * delay_factor)
-    for i in range(delay_samples, len(audio_data)):
-        echo_audio[i] += decay * audio_data[i - delay_samples]
-    return echo_audio
+    return feedforward_echo(audio_data, sr, delay_time=delay_factor, decay=decay, taps=taps)
 
 
 def apply_reverb(audio_data, sr, reverb_amount=0.7):
@@ -71,33 +47,29 @@ def apply_reverb(audio_data, sr, reverb_amount=0.7):
 
 def apply_girl_voice(audio_data, sr):
     # Apply pitch shifting to increase the pitch
-    girl_voice = librosa.effects.pitch_shift(audio_data, sr=sr, n_steps=12)  # Increase the pitch by 12 semitones
-
-    # Apply time stretching for a more natural sound
-    girl_voice = librosa.effects.time_stretch(girl_voice, rate=1.2)  # Increase the duration by 20%
+    # Increase the pitch by 12 semitones and apply time stretching for a more natural sound
+    girl_voice = pitch_and_speed(audio_data, sr, semitones=12, rate=1.2)
 
     # Apply fade in/out for smoothness
     fade_length = int(0.03 * sr)  # Length of fade in samples
     fade_in = np.linspace(0, 1, fade_length)
     fade_out = np.linspace(1, 0, fade_length)
-    girl_voice[:fade_length] *= fade_in
-    girl_voice[-fade_length:] *= fade_out
+    girl_voice[..., :fade_length] *= fade_in
+    girl_voice[..., -fade_length:] *= fade_out
 
     return girl_voice
 
 
 def apply_alien_voice(audio_data, sr):
     # Apply an alien voice effect with pitch shifting, time stretching, and volume modulation
-    alien_voice_pitch = pitch_shift(audio_data, sr, semitone_shift=12)
-    alien_voice_stretch = change_speed(alien_voice_pitch, rate=1.5)
+    alien_voice_stretch = pitch_and_speed(audio_data, sr, semitones=12, rate=1.5)
     alien_voice_modulated = increase_volume(alien_voice_stretch, volume_factor=0.8)
     return alien_voice_modulated
 
 
 def apply_robotic_voice(audio_data, sr):
     # Apply a robotic voice effect
-    robotic_voice_pitch = pitch_shift(audio_data, sr, semitone_shift=-3)
-    robotic_voice_speed = change_speed(robotic_voice_pitch, rate=1.2)
+    robotic_voice_speed = pitch_and_speed(audio_data, sr, semitones=-3, rate=1.2)
     return robotic_voice_speed
 
 
@@ -107,9 +79,9 @@ def apply_child_voice(audio_data, sr):
     return child_voice
 
 
-def apply_reversed_voice(audio_data):
+def apply_reversed_voice(audio_data, sr=None):
     # Apply a reversed voice effect
-    reversed_voice = audio_data[::-1]
+    reversed_voice = audio_data[..., ::-1]
     return reversed_voice
 
 
@@ -133,9 +105,7 @@ def apply_helium_voice(audio_data, sr):
 
 def apply_telephone_voice(audio_data, sr):
     # Apply a telephone-like voice effect by applying a bandpass filter
-    lowcut = 300.0
-    highcut = 3400.0
-    sos = butter(10, [lowcut, highcut], btype='band', fs=sr, output='sos')
+    sos = preset_sos("telephone", sr)
     telephone_voice = sosfilt(sos, audio_data)
     return telephone_voice
 
@@ -148,12 +118,11 @@ def apply_chipmunk_voice(audio_data, sr):
 
 def apply_slow_motion_voice(audio_data, sr):
     # Apply a slow-motion voice effect
-    slow_voice_pitch = pitch_shift(audio_data, sr, semitone_shift=-5)
-    slow_voice_speed = change_speed(slow_voice_pitch, rate=0.5)
+    slow_voice_speed = pitch_and_speed(audio_data, sr, semitones=-5, rate=0.5)
     return slow_voice_speed
 
 
-def apply_distorted_voice(audio_data):
+def apply_distorted_voice(audio_data, sr=None):
     # Apply a distorted voice effect
     distorted_voice = np.clip(audio_data * 10, -1, 1)
     return distorted_voice
@@ -161,9 +130,7 @@ def apply_distorted_voice(audio_data):
 
 def apply_underwater_voice(audio_data, sr):
     # Apply an underwater voice effect
-    lowcut = 300.0
-    highcut = 600.0
-    sos = butter(10, [lowcut, highcut], btype='band', fs=sr, output='sos')
+    sos = preset_sos("underwater", sr)
     underwater_voice = sosfilt(sos, audio_data)
     return underwater_voice
 
@@ -182,32 +149,26 @@ def apply_monster_voice(audio_data, sr):
     return monster_voice
 
 
-def apply_whisper_voice(audio_data):
+def apply_whisper_voice(audio_data, sr=None):
     # Apply a whisper-like effect by reducing volume and adding white noise
     whisper_audio = audio_data * 0.2
-    noise = np.random.normal(0, 0.02, len(audio_data))
+    noise = np.random.normal(0, 0.02, audio_data.shape)
     whisper_audio += noise
     return whisper_audio
 
 
 def apply_radio_voice(audio_data, sr):
     # Apply a radio-like effect by using a bandpass filter and adding noise
-    lowcut = 300.0
-    highcut = 3000.0
-    sos = butter(10, [lowcut, highcut], btype='band', fs=sr, output='sos')
+    sos = preset_sos("radio", sr)
     radio_voice = sosfilt(sos, audio_data)
-    noise = np.random.normal(0, 0.01, len(audio_data))
+    noise = np.random.normal(0, 0.01, audio_data.shape)
     radio_voice += noise
     return radio_voice
 
 
-def apply_strong_echo(audio_data, sr, delay_factor=0.7, decay=0.7):
+def apply_strong_echo(audio_data, sr, delay_factor=0.7, decay=0.7, taps=1):
     # Apply a strong echo effect
-    echo_audio = np.copy(audio_data)
-    delay_samples = int(sr * delay_factor)
-    for i in range(delay_samples, len(audio_data)):
-        echo_audio[i] += decay * audio_data[i - delay_samples]
-    return echo_audio
+    return feedforward_echo(audio_data, sr, delay_time=delay_factor, decay=decay, taps=taps)
 
 
 def apply_cave_voice(audio_data, sr):
@@ -218,9 +179,7 @@ def apply_cave_voice(audio_data, sr):
 
 def apply_megaphone_voice(audio_data, sr):
     # Apply a megaphone-like effect with bandpass filtering and distortion
-    lowcut = 500.0
-    highcut = 5000.0
-    sos = butter(10, [lowcut, highcut], btype='band', fs=sr, output='sos')
+    sos = preset_sos("megaphone", sr)
     megaphone_voice = sosfilt(sos, audio_data)
     megaphone_voice = np.clip(megaphone_voice * 5, -1, 1)
     return megaphone_voice
@@ -240,7 +199,7 @@ def apply_deep_robot_voice(audio_data, sr):
     return robot_voice
 
 
-def apply_fuzzy_voice(audio_data):
+def apply_fuzzy_voice(audio_data, sr=None):
     # Apply a fuzzy voice effect by adding distortion
     fuzzy_voice = np.clip(audio_data * 4, -1, 1)
     return fuzzy_voice
@@ -248,24 +207,12 @@ def apply_fuzzy_voice(audio_data):
 
 def apply_tremolo_voice(audio_data, sr):
     # Apply a tremolo effect by modulating the amplitude
-    t = np.arange(len(audio_data)) / sr
+    t = np.arange(audio_data.shape[-1]) / sr
     tremolo = 0.5 * (1.0 + np.sin(2.0 * np.pi * 5.0 * t))
     tremolo_voice = audio_data * tremolo
     return tremolo_voice
 
 
-def apply_flanger_voice(audio_data, sr):
-    # Apply a flanger effect
-    flanger_audio = np.copy(audio_data)
-    max_delay = int(0.003 * sr)  # 3 ms delay
-    delay_samples = np.arange(0, max_delay)
-    modulation = 0.5 * (1 + np.sin(2 * np.pi * 0.25 * np.arange(len(audio_data)) / sr))
-    for i in range(max_delay, len(audio_data)):
-        delay = int(modulation[i] * max_delay)
-        flanger_audio[i] += 0.5 * audio_data[i - delay]
-    return flanger_audio
-
-
 def apply_squeaky_voice(audio_data, sr):
     # Apply a squeaky-like effect by shifting pitch up significantly
     squeaky_voice = pitch_shift(audio_data, sr, semitone_shift=15)
@@ -288,23 +235,8 @@ def apply_radioactive_voice(audio_data, sr):
 
 
 def apply_wobble_voice(audio_data, sr, wobble_frequency=5.0, wobble_width=0.5):
-    # Apply a wobble effect using pitch modulation
-    t = np.arange(len(audio_data)) / sr
-    modulator = wobble_width * np.sin(2 * np.pi * wobble_frequency * t)
-
-    # Create a buffer to store the wobble effect
-    wobble_audio = np.zeros_like(audio_data)
-
-    # Apply pitch shift in small chunks to simulate the wobble effect
-    chunk_size = 1024
-    for i in range(0, len(audio_data), chunk_size):
-        end = i + chunk_size
-        chunk = audio_data[i:end]
-        pitch_shift = modulator[i:end].mean()
-        shifted_chunk = librosa.effects.pitch_shift(chunk, sr=sr, n_steps=pitch_shift)
-        wobble_audio[i:end] = shifted_chunk
-
-    return wobble_audio
+    # Apply a wobble effect by modulating the pitch with a sine LFO, in one pass through a modulated delay line
+    return vibrato(audio_data, sr, rate=wobble_frequency, semitones=wobble_width)
 
 
 def apply_deep_voice(audio_data, sr):
@@ -316,7 +248,7 @@ def apply_deep_voice(audio_data, sr):
 def apply_breathy_voice(audio_data, sr):
     # Apply a breathy effect by adding white noise
     breathy_voice = audio_data * 0.8
-    noise = np.random.normal(0, 0.05, len(audio_data))
+    noise = np.random.normal(0, 0.05, audio_data.shape)
     breathy_voice += noise
     return breathy_voice
 
@@ -328,13 +260,8 @@ def apply_stadium_voice(audio_data, sr):
 
 
 def apply_stuttering_voice(audio_data, sr, stutter_factor=0.1):
-    # Apply a stuttering effect by repeating small segments
-    segment_length = int(sr * stutter_factor)
-    stuttering_voice = []
-    for i in range(0, len(audio_data), segment_length):
-        stuttering_voice.extend(audio_data[i:i + segment_length])
-        stuttering_voice.extend(audio_data[i:i + int(segment_length / 2)])
-    return np.array(stuttering_voice)
+    # Apply a stuttering effect by repeating the first half of every small segment
+    return rearrange(audio_data, *stutter(audio_data.shape[-1], int(sr * stutter_factor)))
 
 
 def apply_time_warp_voice(audio_data, sr):
@@ -353,16 +280,14 @@ def apply_ethereal_voice(audio_data, sr):
 
 def apply_broken_robot_voice(audio_data, sr):
     # Apply a broken robot effect using pitch shift, distortion, and time stretching
-    broken_robot_voice = pitch_shift(audio_data, sr, semitone_shift=-4)
+    broken_robot_voice = pitch_and_speed(audio_data, sr, semitones=-4, rate=0.8)
     broken_robot_voice = np.clip(broken_robot_voice * 1.5, -1, 1)
-    broken_robot_voice = change_speed(broken_robot_voice, rate=0.8)
     return broken_robot_voice
 
 
 def apply_alien_invasion_voice(audio_data, sr):
     # Apply an alien invasion effect using pitch shift and time stretching
-    alien_invasion_voice = pitch_shift(audio_data, sr, semitone_shift=12)
-    alien_invasion_voice = change_speed(alien_invasion_voice, rate=0.7)
+    alien_invasion_voice = pitch_and_speed(audio_data, sr, semitones=12, rate=0.7)
     return alien_invasion_voice
 
 
@@ -380,34 +305,18 @@ def apply_giant_voice(audio_data, sr):
 
 def apply_cyborg_voice(audio_data, sr):
     # Apply a cyborg voice effect by combining pitch shifting and time stretching
-    cyborg_voice = pitch_shift(audio_data, sr, semitone_shift=-4)
-    cyborg_voice = change_speed(cyborg_voice, rate=0.8)
+    cyborg_voice = pitch_and_speed(audio_data, sr, semitones=-4, rate=0.8)
     return cyborg_voice
 
 
 def apply_vibrato_voice(audio_data, sr, vibrato_frequency=5.0, vibrato_depth=0.5):
-    # Apply a vibrato effect using frequency modulation
-    t = np.arange(len(audio_data)) / sr
-    modulator = vibrato_depth * np.sin(2 * np.pi * vibrato_frequency * t)
-
-    # Create a buffer to store the vibrato effect
-    vibrato_audio = np.zeros_like(audio_data)
-
-    # Apply pitch shift in small chunks to simulate the vibrato effect
-    chunk_size = 1024
-    for i in range(0, len(audio_data), chunk_size):
-        end = i + chunk_size
-        chunk = audio_data[i:end]
-        pitch_shift_amount = modulator[i:end].mean()
-        shifted_chunk = librosa.effects.pitch_shift(chunk, sr=sr, n_steps=pitch_shift_amount)
-        vibrato_audio[i:end] = shifted_chunk
-
-    return vibrato_audio
+    # Apply a vibrato effect by modulating the pitch with a sine LFO, in one pass through a modulated delay line
+    return vibrato(audio_data, sr, rate=vibrato_frequency, semitones=vibrato_depth)
 
 
 def apply_robot_voice_vocoder(audio_data, sr):
     # Apply a robotic effect using a vocoder-like effect
-    robot_voice = librosa.effects.harmonic(audio_data)
+    robot_voice = analysis.harmonic(audio_data)
     robot_voice = pitch_shift(robot_voice, sr, semitone_shift=-3)
     return robot_voice
 
@@ -422,7 +331,7 @@ def apply_radioactive_voice(audio_data, sr):
 
 def apply_deep_sea_voice(audio_data, sr):
     # Apply a deep sea effect using a combination of low-pass filter and reverb
-    sos = butter(10, 200, btype='low', fs=sr, output='sos')
+    sos = preset_sos("deep_sea", sr)
     deep_sea_voice = sosfilt(sos, audio_data)
     deep_sea_voice = apply_reverb(deep_sea_voice, sr, reverb_amount=0.9)
     return deep_sea_voice
@@ -437,7 +346,7 @@ def apply_darth_vader_voice(audio_data, sr):
 
 def apply_radio_announcer_voice(audio_data, sr):
     # Apply a radio announcer effect using equalization and slight reverb
-    sos = butter(10, [100, 5000], btype='band', fs=sr, output='sos')
+    sos = preset_sos("radio_announcer", sr)
     radio_announcer_voice = sosfilt(sos, audio_data)
     radio_announcer_voice = apply_reverb(radio_announcer_voice, sr, reverb_amount=0.2)
     return radio_announcer_voice
@@ -452,9 +361,8 @@ def apply_ghostly_whisper_voice(audio_data, sr):
 
 def apply_cylon_voice(audio_data, sr):
     # Apply a Cylon effect by combining pitch shift, time stretch, and ring modulation
-    cylon_voice = pitch_shift(audio_data, sr, semitone_shift=-6)
-    cylon_voice = change_speed(cylon_voice, rate=0.8)
-    t = np.arange(len(cylon_voice)) / sr
+    cylon_voice = pitch_and_speed(audio_data, sr, semitones=-6, rate=0.8)
+    t = np.arange(cylon_voice.shape[-1]) / sr
     modulator = np.sin(2 * np.pi * 30 * t)  # 30 Hz ring modulation
     cylon_voice = cylon_voice * modulator
     return cylon_voice
@@ -470,7 +378,7 @@ def apply_evil_witch_voice(audio_data, sr):
 def apply_digital_glitch_voice(audio_data, sr):
     # Apply a digital glitch effect using random noise injection
     glitch_factor = 0.05  # Adjust glitch intensity as needed
-    glitched_audio = audio_data + glitch_factor * np.random.normal(size=len(audio_data))
+    glitched_audio = audio_data + glitch_factor * np.random.normal(size=audio_data.shape)
     return glitched_audio
 
 
@@ -500,7 +408,7 @@ def apply_mad_scientist_voice(audio_data, sr):
 def apply_fairy_voice(audio_data, sr):
     # Apply a fairy effect using pitch shift with modulation
     fairy_voice = librosa.effects.pitch_shift(audio_data, sr, n_steps=2)
-    t = np.linspace(0, len(fairy_voice) / sr, len(fairy_voice))
+    t = np.linspace(0, fairy_voice.shape[-1] / sr, fairy_voice.shape[-1])
     modulator = np.sin(2 * np.pi * 1.5 * t)  # Modulation frequency of 1.5 Hz
     fairy_voice *= 1 + 0.2 * modulator  # Adjust modulation depth as needed
     return fairy_voice
@@ -510,7 +418,7 @@ def apply_cybernetic_voice(audio_data, sr):
     # Apply a cybernetic effect using pitch shift, distortion, and ring modulation
     cybernetic_voice = pitch_shift(audio_data, sr, semitone_shift=3)
     cybernetic_voice = np.clip(cybernetic_voice * 1.4, -1, 1)
-    t = np.arange(len(cybernetic_voice)) / sr
+    t = np.arange(cybernetic_voice.shape[-1]) / sr
     modulator = np.sin(2 * np.pi * 20 * t)  # 20 Hz ring modulation
     cybernetic_voice = cybernetic_voice * modulator
     return cybernetic_voice
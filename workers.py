@@ -0,0 +1,123 @@
+import asyncio
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from config import EXECUTOR_BACKEND, PROCESS_START_METHOD, PROCESS_WORKERS, THREAD_WORKERS
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _thread_pool():
+    with _pools_lock:
+        if "thread" not in _pools:
+            _pools["thread"] = ThreadPoolExecutor(max_workers=THREAD_WORKERS, thread_name_prefix="voice-changer")
+        return _pools["thread"]
+
+
+def _process_pool():
+    with _pools_lock:
+        if "process" not in _pools:
+            context = multiprocessing.get_context(PROCESS_START_METHOD)
+            _pools["process"] = ProcessPoolExecutor(max_workers=PROCESS_WORKERS, mp_context=context)
+        return _pools["process"]
+
+
+def shutdown_workers():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _pools.clear()
+
+
+def backend_for(gil_bound):
+    if EXECUTOR_BACKEND != "auto":
+        return EXECUTOR_BACKEND
+    return "process" if gil_bound else "thread"
+
+
+def _to_shared(array):
+    # Copy an array into a new shared memory block; the caller owns (and must unlink) the block
+    array = np.ascontiguousarray(array)
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+
+def _from_shared(name, shape, dtype):
+    # Copy an array out of a shared memory block created by the other side, then free the block
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        return np.ndarray(shape, dtype=dtype, buffer=block.buf).copy()
+    finally:
+        block.close()
+        block.unlink()
+
+
+def _run_shared(func, name, shape, dtype, args, kwargs):
+    # Process-pool entry point: the input is read from, and the output returned through, shared memory.
+    # A function returning a list of arrays gets a list of descriptors back.
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        audio_data = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        processed = func(audio_data, *args, **kwargs)
+        is_list = isinstance(processed, list)
+        descriptors = []
+        for output in processed if is_list else [processed]:
+            result, descriptor = _to_shared(output)
+            result.close()
+            descriptors.append(descriptor)
+        # Release every view on the input block before closing it
+        del audio_data, processed, output
+        return descriptors if is_list else descriptors[0]
+    finally:
+        block.close()
+
+
+def _discard_shared(future):
+    # Done callback for a process-pool call whose caller went away: free the output blocks nobody reads
+    if future.cancelled() or future.exception() is not None:
+        return
+    descriptor = future.result()
+    for name, _, _ in descriptor if isinstance(descriptor, list) else [descriptor]:
+        block = shared_memory.SharedMemory(name=name)
+        block.close()
+        block.unlink()
+
+
+async def run_blocking(func, *args, **kwargs):
+    # Run a blocking call on the thread pool so the event loop keeps serving other requests
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_thread_pool(), functools.partial(func, *args, **kwargs))
+
+
+async def run_effect(func, audio_data, *args, gil_bound=False, **kwargs):
+    # Run an effect function on the backend configured for it; numpy/scipy-heavy effects release the GIL
+    # and use threads, GIL-bound ones go to worker processes with the audio passed through shared memory
+    backend = backend_for(gil_bound)
+    if backend == "inline":
+        return func(audio_data, *args, **kwargs)
+    if backend == "thread":
+        return await run_blocking(func, audio_data, *args, **kwargs)
+    if backend != "process":
+        raise ValueError(f"Unknown executor backend: {backend}")
+
+    block, (name, shape, dtype) = _to_shared(audio_data)
+    future = _process_pool().submit(_run_shared, func, name, shape, dtype, args, kwargs)
+    try:
+        descriptor = await asyncio.wrap_future(future)
+    except asyncio.CancelledError:
+        # A running worker still writes its output to shared memory; free it once the worker is done
+        future.add_done_callback(_discard_shared)
+        raise
+    finally:
+        block.close()
+        block.unlink()
+    if isinstance(descriptor, list):
+        return [_from_shared(*item) for item in descriptor]
+    return _from_shared(*descriptor)